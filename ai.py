@@ -1,24 +1,66 @@
 import math
 from time import perf_counter
-from tetris import is_colliding
-from tetromino import Tetromino
+import tetromino as tetromino_module
+from tetromino import Tetromino, get_tetromino_type
 from random import random, randint
 from copy import deepcopy
+from itertools import count
+from transposition import TranspositionTable
+import movegen
+
+# numpy is only needed when scoring placements in batches
+try:
+    import vectorized
+except ImportError:
+    vectorized = None
+
+# evaluations shared by every AI in this process, keyed on the genome id of the
+# AI and the board, None when disabled
+transposition_table = None
+
+# source of unique ids for weight vectors
+genome_ids = count()
+
+def enable_transposition_table(capacity):
+    """Caches board evaluations of every AI, up to capacity entries."""
+
+    global transposition_table
+    transposition_table = TranspositionTable(capacity) if capacity > 0 else None
 
 class TetrisAI:
     def __init__(self, grid_width, grid_height,
-        row_filled_weights=[], hole_height_weights=[], column_diff_weights=[]):
+        row_filled_weights=[], hole_height_weights=[], column_diff_weights=[],
+        batch_scoring=False, lookahead_depth=1, beam_width=0, move_generator='bfs'):
         self.grid_width = grid_width
         self.grid_height = grid_height
         self.row_filled_weights = row_filled_weights
         self.hole_height_weights = hole_height_weights
         self.column_diff_weights = column_diff_weights
+        # score all placements of a move at once with numpy
+        self.batch_scoring = batch_scoring
+        if batch_scoring and vectorized is None:
+            raise ImportError('numpy is required for batch scoring')
+        # number of tetrominos to place ahead when choosing a move, the current
+        # and next tetromino are known, any further are averaged over all types
+        # only the beam_width best placements by score are explored at every
+        # step of the search (0 explores all of them)
+        self.lookahead_depth = lookahead_depth
+        self.beam_width = beam_width
+        # how placements are found: 'drop' drops every rotation straight down
+        # from the top, 'bfs' searches every position reachable from where
+        # the tetromino spawns (see movegen.py)
+        if move_generator not in ('drop', 'bfs'):
+            raise ValueError(f'Unknown move generator: {move_generator}')
+        self.move_generator = move_generator
         # number of weights to use for hole height and column diff heuristics
         # note that row filled weights uses grid_width + 1 weights
         #trọng lượng số lượng ô chiều rộng sử dụng cho chiều cao ô và cột khác tự phát 
         #chú ý rằng dòng được lắp đầy vào ô sử dụng _ 1 chiều rộng
         self.hole_height_cap = 5
         self.column_diff_cap = 5
+        # identifies this weight vector in the transposition table, changes
+        # whenever the weights do
+        self.genome_id = next(genome_ids)
         # generate random weights if not provided
         #khởi tạo tự động khung trò chơi nếu không cung cấp 
         if len(row_filled_weights) == 0: 
@@ -30,6 +72,7 @@ class TetrisAI:
         if len(column_diff_weights) == 0:
             for i in range(self.column_diff_cap):
                 self.column_diff_weights.append(self.random_weight())
+        self.build_tables()
 
         # weights that have achieved 57580 line clears before (computer ran for a whole day training this!)
         # uncomment to try them out
@@ -42,150 +85,247 @@ class TetrisAI:
     #loại tetromino được sử dụng 
     def compute_move(self, inst):
         best_move = (float('-inf'), None)
-        grid = self.to_boolean_grid(inst.grid)
+        board = inst.board.copy()
+        if self.lookahead_depth > 1:
+            return self.compute_move_lookahead(board, inst)
         # compute moves available with the current tetromino: ước tính di chuyển có sẵn với tetromino hiện có 
-        first_moves = self.compute_moves_available(grid, inst.current_tmino)
-        # for every move with the current tetromino,
-        # compute moves available with the next tetromino
-        # với mỗi lần di chuyển với tetro hiện tại tính toán sự di chuyển có sẵn  với tetro tiếp theo
+        first_moves = self.compute_moves(board, inst.current_tmino)
+        if self.batch_scoring:
+            return self.compute_move_batch(board, inst.current_tmino, first_moves)
+        # score the board once, each placement then only rescores the rows
+        # and columns it touches
+        terms = self.compute_score_terms(board)
         for move1 in first_moves:
             # determine a score for each move: 3 loại: trên, trái, phải
             tmino1 = Tetromino(inst.current_tmino.id, move1[0], move1[1], move1[2])
-            self.add_to_grid(grid, tmino1)
-            score = self.compute_score(grid)
+            board.add(tmino1)
+            score = self.compute_score_delta(board, tmino1, terms)
             if score > best_move[0]:
                 best_move = (score, Tetromino(inst.current_tmino.id, move1[0], move1[1], move1[2]))
-            self.remove_from_grid(grid, tmino1)
-
-            # the code below is an experimental scoring function
-            # it returns the average of the scores of the next tetromino placement
-            # note that this however runs exponentially slower then the code above
-            # mã bên dưới là một chức năng tính điểm thử nghiệm
-             # nó trả về điểm trung bình của điểm của vị trí tetromino tiếp theo
-             # lưu ý rằng điều này tuy nhiên chạy chậm hơn theo cấp số nhân so với mã ở trên
-            """# compute possible moves for the next tetromino
-            tmino1 = Tetromino(inst.current_tmino.id, move1[0], move1[1], move1[2])
-            self.add_to_grid(grid, tmino1)
-            sum_score = 0
-            second_moves = self.compute_moves_available(grid, inst.next_tmino)
-            for move2 in second_moves:
-                tmino2 = Tetromino(inst.next_tmino.id, move2[0], move2[1], move2[2])
-                self.add_to_grid(grid, tmino2)
-                sum_score += self.compute_score(grid)
-                self.remove_from_grid(grid, tmino2)
-            self.remove_from_grid(grid, tmino1)
-
-            avg_score = float('-inf') if len(second_moves) == 0 else sum_score / len(second_moves)
-            if avg_score >= best_move[0]:
-                best_move = (avg_score, Tetromino(inst.current_tmino.id, move1[0], move1[1], move1[2]))"""
+            board.undo()
         return best_move[1]
 
+    # determine a move by searching lookahead_depth tetrominos ahead
+    # for every placement of the current tetromino, compute the placements
+    # available with the next tetromino, keeping only the beam_width best
+    # placements at every step so that the cost stays bounded
+    # với mỗi lần di chuyển với tetro hiện tại tính toán sự di chuyển có sẵn  với tetro tiếp theo
+    def compute_move_lookahead(self, board, inst):
+        best_move = (float('-inf'), None)
+        for score, move in self.rank_moves(board, inst.current_tmino.id):
+            tmino = Tetromino(inst.current_tmino.id, move[0], move[1], move[2])
+            child = board.copy()
+            cleared = child.place(tmino)
+            score = (self.compute_lookahead_score(child, [inst.next_tmino.id], self.lookahead_depth - 1)
+                + cleared * self.compute_line_clear_bonus())
+            if score > best_move[0] or best_move[1] is None:
+                best_move = (score, tmino)
+        return best_move[1]
+
+    # computes the best score reachable by placing depth more tetrominos, the
+    # ids of the known upcoming tetrominos are used first, after which the
+    # score is averaged over every type of tetromino
+    def compute_lookahead_score(self, board, known_ids, depth):
+        if len(known_ids) > 0:
+            ids = known_ids[:1]
+        else:
+            ids = [i for i in range(1, tetromino_module.unique_types + 1)]
+        sum_score = 0
+        for id in ids:
+            ranked = self.rank_moves(board, id)
+            if len(ranked) == 0:
+                # the game would be lost
+                return float('-inf')
+            if depth == 1:
+                # the moves are already scored
+                sum_score += ranked[0][0]
+                continue
+            best_score = float('-inf')
+            for score, move in ranked:
+                child = board.copy()
+                cleared = child.place(Tetromino(id, move[0], move[1], move[2]))
+                best_score = max(best_score, self.compute_lookahead_score(child, known_ids[1:], depth - 1)
+                    + cleared * self.compute_line_clear_bonus())
+            sum_score += best_score
+        return sum_score / len(ids)
+
+    # lines are cleared between the placements of the search, unlike when
+    # scoring a single placement where a filled row still counts towards the
+    # score. this restores the difference between a filled and an empty row
+    # for every line cleared, so that clearing lines early is not penalized
+    def compute_line_clear_bonus(self):
+        return self.row_filled_weights[self.grid_width] - self.row_filled_weights[0]
+
+    # scores every placement of a tetromino, returns the beam_width best
+    # (score, move) tuples from highest to lowest score
+    def rank_moves(self, board, id):
+        # the same boards come up again within a search and when the next move
+        # is computed, look them up in the transposition table first
+        if transposition_table is not None:
+            key = (self.genome_id, id, board.pack())
+            ranked = transposition_table.get(key)
+            if ranked is not None:
+                return ranked
+        ranked = []
+        terms = self.compute_score_terms(board)
+        for move in self.compute_moves(board, Tetromino(id)):
+            tmino = Tetromino(id, move[0], move[1], move[2])
+            board.add(tmino)
+            ranked.append((self.compute_score_delta(board, tmino, terms), move))
+            board.undo()
+        # sorting is stable, so equally scored moves keep their order
+        ranked.sort(key=lambda elem: elem[0], reverse=True)
+        if self.beam_width > 0:
+            ranked = ranked[:self.beam_width]
+        if transposition_table is not None:
+            transposition_table.put(key, ranked)
+        return ranked
+
+    # describes how moves are searched for, used in the generation stats
+    def describe_search(self):
+        generator = ', straight drops only' if self.move_generator == 'drop' else ''
+        if self.lookahead_depth <= 1:
+            return 'single tetromino' + (' (batch scoring)' if self.batch_scoring else '') + generator
+        return f'lookahead depth {self.lookahead_depth}, beam width ' + (
+            str(self.beam_width) if self.beam_width > 0 else 'unlimited') + generator
+
+    # options that are not part of the weights, passed on to offspring
+    def get_options(self):
+        return {
+            'batch_scoring': self.batch_scoring,
+            'lookahead_depth': self.lookahead_depth,
+            'beam_width': self.beam_width,
+            'move_generator': self.move_generator,
+        }
+
+    # scores every placement at once and returns the best one
+    def compute_move_batch(self, board, tetromino, moves):
+        if len(moves) == 0:
+            return None
+        boards = vectorized.candidate_boards(board, tetromino.id, moves)
+        scores = vectorized.score_boards(boards,
+            self.row_filled_weights, self.hole_height_weights, self.column_diff_weights)
+        # argmax picks the first best move, just like the sequential loop
+        best = moves[int(scores.argmax())]
+        return Tetromino(tetromino.id, best[0], best[1], best[2])
+
+    # computes the placements of a tetromino with the move generator of this AI
+    def compute_moves(self, board, tetromino):
+        if self.move_generator == 'bfs':
+            return movegen.reachable_moves(board, tetromino.id)
+        return self.compute_moves_available(board, tetromino)
+
     # computes all possible drop placements that can be made
     # tính toán tất cả các vị trí thả có thể được thực hiện
-    def compute_moves_available(self, grid, tetromino):
-        heights = self.compute_heightmap(grid)
+    def compute_moves_available(self, board, tetromino):
+        heights = board.heights
         possible_moves = []
         # consider each rotation
         #xem xét từng di chuyển
         for rotation in tetromino.unique_rotations_list:
-            # to compute each possible drop placement, first find the largest value
-            # in the heightmap that contains the tetromino at each section of columns
+            # the precomputed skirt of the tetromino gives the resting height of
+            # a straight drop directly from the heightmap, the bottom of the
+            # tetromino box rests at the greatest column height minus skirt
             # để tính toán từng vị trí thả có thể xảy ra, trước tiên hãy tìm giá trị lớn nhất
               # trong bản đồ chiều cao có chứa tetromino ở mỗi phần của cột
-            current_tmino = Tetromino(tetromino.id, rotation)
-            for i in range(current_tmino.min_x, current_tmino.max_x + 1):
-                current_tmino.x_pos = i
-                # find greatest height
-                greatest_height = 0
-                for j in range(i, i + current_tmino.size):
-                    # check for out of bounds
-                    if j >= 0 and j < len(grid):
-                        if heights[j] > greatest_height:
-                            greatest_height = heights[j]
-                # we are guaranteed that the tetromino will not have collided with
-                # anything before this greatest height value, all that is needed
-                # to do now is to find the correct point of contact
-                # chúng tôi đảm bảo rằng tetromino sẽ không va chạm với
-                # bất kỳ thứ gì trước giá trị chiều cao lớn nhất này, tất cả những gì cần thiết
-                # việc cần làm bây giờ là tìm đúng điểm liên hệ
-                for j in range(max(len(grid[0]) - greatest_height - current_tmino.size, current_tmino.min_y), current_tmino.max_y + 1):
-                    current_tmino.y_pos = j
-                    if is_colliding(grid, current_tmino):
-                        current_tmino.y_pos = j - 1
-                        break
-                if not is_colliding(grid, current_tmino):
+            tmino_type = get_tetromino_type(tetromino.id, rotation)
+            skirt = tmino_type.skirt
+            for x in tmino_type.legal_x:
+                col = x + tmino_type.col_offset
+                base = max([heights[col + i] - skirt[i] for i in range(len(skirt))])
+                y = board.grid_height - tmino_type.size - base
+                # the tetromino does not fit if it would stick out of the top
+                if y >= tmino_type.min_y:
                     # tetromino is now at a possible placement
-                    possible_moves.append((rotation, current_tmino.x_pos, current_tmino.y_pos))
+                    possible_moves.append((rotation, x, y))
         return possible_moves
 
-    # computes a score for the given binary grid arrangement nhị phân
-    # True should indicate an occupied cell, False should indicate empty cell
-    def compute_score(self, grid):
-        # add to score based on how filled the rows are
-        score = 0
-        for y in range(self.grid_height):
-            cells_filled = 0
-            for x in range(self.grid_width):
-                if grid[x][y]:
-                    cells_filled += 1
-            score += self.row_filled_weights[cells_filled]
+    # expands the weights into lookup tables so that scoring needs no clamping
+    # row_table[count] is the weight of a row with count cells filled,
+    # hole_table[height] and floor_hole_table[height] the penalty of a hole
+    # of that height above or reaching the floor, and
+    # diff_table[diff + grid_height] the penalty of a difference in height
+    # between two columns. must be called whenever the weights change
+    def build_tables(self):
+        self.row_table = tuple(self.row_filled_weights)
+        self.hole_table = tuple([0] + [self.hole_height_weights[min(height, self.hole_height_cap) - 1]
+            for height in range(1, self.grid_height + 1)])
+        self.floor_hole_table = tuple([self.hole_height_weights[min(height, self.hole_height_cap - 1)]
+            for height in range(self.grid_height + 1)])
+        self.diff_table = tuple([self.column_diff_weights[min(abs(diff), self.column_diff_cap - 1)]
+            for diff in range(-self.grid_height, self.grid_height + 1)])
 
-        # subtract from score based on heights of holes
-        heights = self.compute_heightmap(grid)
-        for x in range(self.grid_width):
-            hole_height = 0
-            for y in range(self.grid_height - heights[x], self.grid_height):
-                if grid[x][y]:
-                    if hole_height > 0:
-                        score -= self.hole_height_weights[min(hole_height, self.hole_height_cap) - 1]
-                        hole_height = 0
-                else:
-                    hole_height += 1
-            if hole_height > 0:
-                score -= self.hole_height_weights[min(hole_height, self.hole_height_cap - 1)]
+    # computes a score for the given bitboard arrangement
+    # every set bit of a row mask indicates an occupied cell
+    def compute_score(self, board):
+        return self.compute_score_terms(board)[3]
 
+    # splits the score of a board into the term of every row, the hole
+    # penalty of every column and the column diff penalty between every column
+    # and the one on its left, returns these along with the total score
+    def compute_score_terms(self, board):
+        # add to score based on how filled the rows are
+        row_table = self.row_table
+        row_terms = [row_table[count] for count in board.row_counts]
+        # subtract from score based on heights of holes
+        hole_terms = [self.compute_hole_penalty(board, x) for x in range(self.grid_width)]
         # subtract from score based on differences in column heights
-        for i in range(1, len(heights)):
-            score -= self.column_diff_weights[min(abs(heights[i] - heights[i - 1]), self.column_diff_cap - 1)]
+        heights = board.heights
+        diff_table = self.diff_table
+        offset = self.grid_height
+        diff_terms = [0] + [diff_table[heights[i] - heights[i - 1] + offset] for i in range(1, len(heights))]
+        return (row_terms, hole_terms, diff_terms,
+            sum(row_terms) - sum(hole_terms) - sum(diff_terms))
+
+    # computes the score of a board right after tmino was added to it, given
+    # the score terms of the board before it was added
+    def compute_score_delta(self, board, tmino, terms):
+        row_terms, hole_terms, diff_terms, score = terms
+        # rows covered by the tetromino
+        row_table = self.row_table
+        row_counts = board.row_counts
+        top = tmino.y_pos + tmino.row_offset
+        for y in range(top, top + len(tmino.row_masks)):
+            score += row_table[row_counts[y]] - row_terms[y]
+        # columns covered by the tetromino
+        left = tmino.x_pos + tmino.col_offset
+        right = left + len(tmino.col_masks)
+        holes = board.holes
+        for x in range(left, right):
+            # columns without holes have no penalty
+            if holes[x] or hole_terms[x]:
+                score -= self.compute_hole_penalty(board, x) - hole_terms[x]
+        # differences between the covered columns and their neighbours
+        heights = board.heights
+        diff_table = self.diff_table
+        offset = self.grid_height
+        for i in range(max(left, 1), min(right + 1, self.grid_width)):
+            score -= diff_table[heights[i] - heights[i - 1] + offset] - diff_terms[i]
         return score
 
-    # finds the heights of the highest occupied cell in each column of a Tetris grid
-    def compute_heightmap(self, grid):
-        column_heights = []
-        for x in range(self.grid_width):
-            found = False
-            for y in range(self.grid_height):
-                if grid[x][y]:
-                    column_heights.append(self.grid_height - y)
-                    found = True
-                    break
-            if not found:
-                column_heights.append(0)
-        return column_heights
-
-    # adds a tetromino to a grid
-    def add_to_grid(self, grid, tmino):
-        for x in range(tmino.size):
-            for y in range(tmino.size):
-                grid_x = x + tmino.x_pos
-                grid_y = y + tmino.y_pos
-                # check if the tmino cell is out of bounds
-                if grid_x < 0 or grid_x >= len(grid) or grid_y < 0 or grid_y >= len(grid[0]):
-                    continue
-                # update the grid cell with the tmino cell
-                if tmino.block_data[x][y]:
-                    grid[grid_x][grid_y] = True
-
-    # removes a tetromino from a grid
-    def remove_from_grid(self, grid, tmino):
-        for x in range(tmino.size):
-            for y in range(tmino.size):
-                grid_x = x + tmino.x_pos
-                grid_y = y + tmino.y_pos
-                if grid_x < 0 or grid_x >= len(grid) or grid_y < 0 or grid_y >= len(grid[0]):
-                    continue
-                if tmino.block_data[x][y]:
-                    grid[grid_x][grid_y] = False
+    # computes the penalty for the holes of a single column
+    # a hole is a run of empty cells below the highest cell of a column
+    def compute_hole_penalty(self, board, x):
+        if board.holes[x] == 0:
+            return 0
+        penalty = 0
+        # empty cells from the highest occupied cell down to the floor
+        top = self.grid_height - board.heights[x]
+        empty = ~board.cols[x] & ((1 << self.grid_height) - 1) & ~((1 << top) - 1)
+        hole_table = self.hole_table
+        while empty:
+            low = empty & -empty
+            # adding the lowest bit carries through the whole run of empty
+            # cells, leaving only the bits of that run
+            run = empty & ~(empty + low)
+            end = run.bit_length()
+            if end == self.grid_height:
+                # the run reaches the floor
+                penalty += self.floor_hole_table[end - low.bit_length() + 1]
+            else:
+                penalty += hole_table[end - low.bit_length() + 1]
+            empty ^= run
+        return penalty
 
     # combines this AI and another by mixing weights
     # returns a new AI with crossovered weights
@@ -198,19 +338,28 @@ class TetrisAI:
         new_column_diff_weights = deepcopy(self.column_diff_weights[:crossover_idx] + ai.column_diff_weights[crossover_idx:])
 
         return TetrisAI(ai.grid_width, ai.grid_height,
-            new_row_filled_weights, new_hole_height_weights, new_column_diff_weights)
+            new_row_filled_weights, new_hole_height_weights, new_column_diff_weights,
+            **self.get_options())
 
     # randomly mutates weights given a mutation rate
     def mutate(self, mutate_rate):# đột biến
+        mutated = False
         for i in range(self.grid_width):
             if random() <= mutate_rate:
                 self.row_filled_weights[i] = self.random_weight()
+                mutated = True
         for i in range(self.hole_height_cap):
             if random() <= mutate_rate:
                 self.hole_height_weights[i] = self.random_weight()
+                mutated = True
         for i in range(self.column_diff_cap):
             if random() <= mutate_rate:
                 self.column_diff_weights[i] = self.random_weight()
+                mutated = True
+        # cached evaluations of the old weights no longer apply
+        if mutated:
+            self.genome_id = next(genome_ids)
+            self.build_tables()
 
     def random_weight(self):
         # produce along the abs of a standard normal distribution curve using the Box-Muller transform
@@ -220,25 +369,18 @@ class TetrisAI:
 
     # returns a deep copy of this AI
     def clone(self):
-        return TetrisAI(
+        ai = TetrisAI(
             self.grid_width, self.grid_height,
             deepcopy(self.row_filled_weights),
             deepcopy(self.hole_height_weights),
-            deepcopy(self.column_diff_weights))
-
-    # returns a boolean representation of the given grid
-    # where False is an empty cell and True is a filled cell
-    # note that this creates a new grid in memory
-    def to_boolean_grid(self, grid):
-        b_grid = []
-        for x in range(len(grid)):
-            b_grid.append([])
-            for y in range(len(grid[0])):
-                b_grid[-1].append(grid[x][y] != 0)
-        return b_grid
-
-    # prints a 2d list with nice formatting
-    def print_grid(self, grid):
-        print('-' * len(grid) * 2)
-        for y in range(len(grid[0])):
-            print(('').join(['#' if grid[x][y] else '.' for x in range(len(grid))]))
+            deepcopy(self.column_diff_weights),
+            **self.get_options())
+        # the weights are identical, so cached evaluations can be shared
+        ai.genome_id = self.genome_id
+        return ai
+
+    # prints a bitboard with nice formatting
+    def print_grid(self, board):
+        print('-' * board.grid_width * 2)
+        for row in board.rows:
+            print(('').join(['#' if row >> x & 1 else '.' for x in range(board.grid_width)]))
@@ -0,0 +1,339 @@
+import os
+import json
+import argparse
+import platform
+import subprocess
+from random import Random
+from time import perf_counter
+import tetromino
+import ai as ai_module
+import movegen
+from ai import TetrisAI
+from tetris import Tetris
+from tetromino import Tetromino
+from evaluator import Budget, play_game
+
+# the genome every benchmark plays with, the weights that cleared 57580 lines
+# (see TetrisAI)
+ROW_FILLED_WEIGHTS = [0.69, 0.55, 0.41, 0.40, 0.31, 0.09, 0.01, 0.23, 0.34, 0.82, 1.48]
+HOLE_HEIGHT_WEIGHTS = [1.34, 1.90, 1.72, 2.08, 2.65]
+COLUMN_DIFF_WEIGHTS = [0.12, 0.29, 0.38, 0.62, 0.86]
+
+class Benchmark:
+    """Measures the speed of the AI hot path on fixed seeded boards.
+
+    The boards are snapshots of a seeded game played by a fixed genome, and
+    the tetrominos dropped on them come from a seeded piece stream, so every
+    run measures exactly the same work.
+    """
+
+    def __init__(self, grid_width=10, grid_height=20, seed=0, num_boards=50,
+        num_moves=1000, num_games=3, max_pieces=500, repeat=3, ai_options={}, transposition_size=0):
+        """
+        Args:
+            seed: Seed of the boards, piece stream and games.
+            num_boards: Number of boards the move generation, scoring and
+                collision benchmarks run on.
+            num_moves: Number of moves computed for moves per second.
+            num_games: Number of games played for games per hour.
+            max_pieces: Pieces after which a benchmark game is stopped.
+            repeat: Number of times each benchmark is run, the fastest counts.
+            ai_options: Options of the benchmarked AI, see TetrisAI.
+            transposition_size: Capacity of the transposition table, 0 to
+                disable it.
+        """
+
+        self.grid_width = grid_width
+        self.grid_height = grid_height
+        self.seed = seed
+        self.num_moves = num_moves
+        self.num_games = num_games
+        self.max_pieces = max_pieces
+        self.repeat = repeat
+        self.ai_options = ai_options
+        self.transposition_size = transposition_size
+        self.boards, self.pieces = self.generate_boards(num_boards)
+
+    def create_ai(self):
+        return TetrisAI(self.grid_width, self.grid_height,
+            ROW_FILLED_WEIGHTS[:], HOLE_HEIGHT_WEIGHTS[:], COLUMN_DIFF_WEIGHTS[:], **self.ai_options)
+
+    def generate_boards(self, num):
+        """Plays a seeded game and keeps a copy of the board every few pieces,
+        along with the id of a tetromino to drop on it."""
+
+        rng = Random(self.seed)
+        ai = TetrisAI(self.grid_width, self.grid_height,
+            ROW_FILLED_WEIGHTS[:], HOLE_HEIGHT_WEIGHTS[:], COLUMN_DIFF_WEIGHTS[:])
+        boards = []
+        pieces = []
+        inst = Tetris(self.grid_width, self.grid_height, self.seed)
+        placed = 0
+        while len(boards) < num:
+            if inst.lost:
+                inst = Tetris(self.grid_width, self.grid_height, rng.randint(0, 2 ** 31 - 1))
+                placed = 0
+            inst.update()
+            if inst.lost:
+                continue
+            inst.next_move = ai.compute_move(inst)
+            # a snapshot every few pieces, once the board has filled up a bit
+            if inst.pieces_placed != placed and inst.pieces_placed % 3 == 0 and inst.pieces_placed >= 10:
+                boards.append(inst.board.copy())
+                pieces.append(rng.randint(1, tetromino.unique_types))
+            placed = inst.pieces_placed
+        return boards, pieces
+
+    def time(self, func):
+        """Returns the fastest of repeat runs of func in seconds, along with
+        the count it returned."""
+
+        best = float('inf')
+        for i in range(self.repeat):
+            start = perf_counter()
+            n = func()
+            best = min(best, perf_counter() - start)
+        return best, n
+
+    def run(self, names=None):
+        """Runs the benchmarks and returns their results by name."""
+
+        results = {}
+        for name, func in BENCHMARKS:
+            if names is None or name in names:
+                results.update(func(self))
+        return results
+
+def bench_moves_available(bench):
+    # the drop only generator and the search over reachable positions
+    ai = bench.create_ai()
+    tminos = [Tetromino(id) for id in bench.pieces]
+
+    def drop():
+        n = 0
+        for board, tmino in zip(bench.boards, tminos):
+            n += len(ai.compute_moves_available(board, tmino))
+        return n
+
+    def reachable():
+        n = 0
+        for board, tmino in zip(bench.boards, tminos):
+            n += len(movegen.reachable_moves(board, tmino.id))
+        return n
+    seconds, placements = bench.time(drop)
+    reachable_seconds, reachable_placements = bench.time(reachable)
+    return {
+        'moves_available_calls_per_sec': len(bench.boards) / seconds,
+        'moves_available_placements_per_sec': placements / seconds,
+        'reachable_moves_calls_per_sec': len(bench.boards) / reachable_seconds,
+        'reachable_moves_placements_per_sec': reachable_placements / reachable_seconds,
+    }
+
+def bench_score(bench):
+    # scoring every placement from scratch and with the delta of the placement
+    ai = bench.create_ai()
+    placements = []
+    for board, tmino_id in zip(bench.boards, bench.pieces):
+        for move in ai.compute_moves_available(board, Tetromino(tmino_id)):
+            placements.append((board, Tetromino(tmino_id, move[0], move[1], move[2])))
+
+    def full():
+        for board, tmino in placements:
+            board.add(tmino)
+            ai.compute_score(board)
+            board.undo()
+        return len(placements)
+
+    def delta():
+        terms = {}
+        for board, tmino in placements:
+            if id(board) not in terms:
+                terms[id(board)] = ai.compute_score_terms(board)
+            board.add(tmino)
+            ai.compute_score_delta(board, tmino, terms[id(board)])
+            board.undo()
+        return len(placements)
+    full_seconds, n = bench.time(full)
+    delta_seconds, n = bench.time(delta)
+    return {
+        'placements_scored_per_sec': n / full_seconds,
+        'placements_scored_delta_per_sec': n / delta_seconds,
+    }
+
+def bench_colliding(bench):
+    # every placement one row below its resting position collides
+    ai = bench.create_ai()
+    checks = []
+    for board, tmino_id in zip(bench.boards, bench.pieces):
+        cells = [[board.rows[y] >> x & 1 for y in range(bench.grid_height)] for x in range(bench.grid_width)]
+        for move in ai.compute_moves_available(board, Tetromino(tmino_id)):
+            for y in (move[2], move[2] + 1):
+                checks.append((board, cells, Tetromino(tmino_id, move[0], move[1], y)))
+
+    def bitboard():
+        for board, cells, tmino in checks:
+            board.is_colliding(tmino)
+        return len(checks)
+
+    def grid():
+        for board, cells, tmino in checks:
+            _is_grid_colliding(cells, tmino)
+        return len(checks)
+    bitboard_seconds, n = bench.time(bitboard)
+    grid_seconds, n = bench.time(grid)
+    return {
+        'bitboard_collisions_per_sec': n / bitboard_seconds,
+        'grid_collisions_per_sec': n / grid_seconds,
+    }
+
+def _is_grid_colliding(grid, tmino):
+    """The cell by cell collision check of a column major grid, grid[x][y],
+    that the bitboard replaced, kept as the baseline of bench_colliding."""
+
+    for x in range(tmino.size):
+        for y in range(tmino.size):
+            if tmino.block_data[x][y]:
+                grid_x = x + tmino.x_pos
+                grid_y = y + tmino.y_pos
+                if (grid_x < 0 or grid_y < 0
+                    or grid_x >= len(grid)
+                    or grid_y >= len(grid[0])
+                    or grid[grid_x][grid_y] != 0):
+                    return True
+    return False
+
+def bench_compute_move(bench):
+    ai_module.enable_transposition_table(bench.transposition_size)
+
+    def func():
+        # a fresh table every run, so that later runs are not faster
+        if ai_module.transposition_table is not None:
+            ai_module.transposition_table.clear()
+        ai = bench.create_ai()
+        rng = Random(bench.seed)
+        inst = Tetris(bench.grid_width, bench.grid_height, bench.seed)
+        n = 0
+        while n < bench.num_moves:
+            if inst.lost:
+                inst = Tetris(bench.grid_width, bench.grid_height, rng.randint(0, 2 ** 31 - 1))
+            inst.update()
+            if inst.lost:
+                continue
+            inst.next_move = ai.compute_move(inst)
+            n += 1
+        return n
+    seconds, n = bench.time(func)
+    results = {'moves_per_sec': n / seconds}
+    if ai_module.transposition_table is not None:
+        results['transposition_hit_rate'] = ai_module.transposition_table.hit_rate()
+    return results
+
+def bench_games(bench):
+    ai_module.enable_transposition_table(bench.transposition_size)
+    budget = Budget(max_pieces=bench.max_pieces)
+
+    def func():
+        ai = bench.create_ai()
+        rng = Random(bench.seed)
+        for i in range(bench.num_games):
+            game_seed = rng.randint(0, 2 ** 31 - 1)
+            play_game(ai, bench.grid_width, bench.grid_height, game_seed, budget)
+        return bench.num_games
+    seconds, n = bench.time(func)
+    return {'games_per_hour': n / seconds * 3600}
+
+# name and function of every benchmark, each function takes the Benchmark
+# and returns a dictionary of results
+BENCHMARKS = [
+    ('moves_available', bench_moves_available),
+    ('score', bench_score),
+    ('colliding', bench_colliding),
+    ('compute_move', bench_compute_move),
+    ('games', bench_games),
+]
+
+def git_commit():
+    """Returns the hash of the checked out commit, or None outside of git."""
+
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+            text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def format_result(name, value):
+    if name.endswith('hit_rate'):
+        return f'{name:>36}: {value:14.3f}'
+    return f'{name:>36}: {value:14.1f}'
+
+def compare(results, baseline):
+    """Prints every result next to the same result of a baseline run."""
+
+    print(f'\nCompared to {baseline.get("commit")}:')
+    for name, value in results.items():
+        old = baseline['results'].get(name)
+        if old is None:
+            print(format_result(name, value) + ' (new)')
+        elif name.endswith('hit_rate'):
+            print(f'{name:>36}: {value:14.3f} vs {old:.3f}')
+        else:
+            print(f'{name:>36}: {value:14.1f} vs {old:.1f} ({value / old:.2f}x)')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks the speed of the Tetris AI.')
+    parser.add_argument('--output', metavar='FILE',
+        help='save the results to a JSON file')
+    parser.add_argument('--compare', metavar='FILE',
+        help='compare the results with those saved by an earlier run')
+    parser.add_argument('--only', nargs='+', choices=[name for name, func in BENCHMARKS],
+        help='run only these benchmarks')
+    parser.add_argument('--seed', type=int, default=0,
+        help='seed of the boards, pieces and games (default: 0)')
+    parser.add_argument('--moves', type=int, default=1000,
+        help='number of moves computed for moves per second (default: 1000)')
+    parser.add_argument('--games', type=int, default=3,
+        help='number of games played for games per hour (default: 3)')
+    parser.add_argument('--max-pieces', type=int, default=500,
+        help='pieces after which a benchmark game is stopped (default: 500)')
+    parser.add_argument('--repeat', type=int, default=3,
+        help='runs of every benchmark, the fastest counts (default: 3)')
+    parser.add_argument('--batch-scoring', action='store_true',
+        help='score placements in batches with numpy')
+    parser.add_argument('--lookahead-depth', type=int, default=1,
+        help='tetrominos placed ahead by the AI (default: 1)')
+    parser.add_argument('--beam-width', type=int, default=0,
+        help='placements explored at every step of the lookahead (default: all)')
+    parser.add_argument('--move-generator', choices=['drop', 'bfs'], default='bfs',
+        help='how the AI finds placements (default: bfs)')
+    parser.add_argument('--transposition-size', type=int, default=0,
+        help='capacity of the transposition table (default: disabled)')
+    args = parser.parse_args()
+
+    tetromino.load('data/shapes.txt', 10, 20)
+    ai_options = {
+        'batch_scoring': args.batch_scoring,
+        'lookahead_depth': args.lookahead_depth,
+        'beam_width': args.beam_width,
+        'move_generator': args.move_generator,
+    }
+    bench = Benchmark(seed=args.seed, num_moves=args.moves, num_games=args.games,
+        max_pieces=args.max_pieces, repeat=args.repeat, ai_options=ai_options,
+        transposition_size=args.transposition_size)
+    results = bench.run(args.only)
+    for name, value in results.items():
+        print(format_result(name, value))
+
+    report = {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'options': dict(ai_options, seed=args.seed, moves=args.moves, games=args.games,
+            max_pieces=args.max_pieces, transposition_size=args.transposition_size),
+        'results': results,
+    }
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            compare(results, json.load(f))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=4)
+        print(f'\nSaved results to {args.output}')
@@ -0,0 +1,190 @@
+class Bitboard:
+    """A Tetris grid where every row is stored as an integer bitmask.
+
+    Bit x of rows[y] is set when the cell at column x and row y is occupied,
+    rows are indexed from the top of the grid, with row 0 at the top. This
+    allows collision, placement, line clear and heightmap operations to be
+    expressed as a handful of bitwise operations per row instead of walking
+    the grid cell by cell.
+
+    The board also maintains, as pieces are added and lines cleared:
+        cols: One bitmask per column, bit y is set when row y is occupied.
+        heights: Height of the highest occupied cell of each column.
+        row_counts: Number of occupied cells in each row.
+        holes: Number of empty cells below the highest cell of each column.
+    Adding a tetromino updates these in O(tetromino size) and can be undone
+    in O(tetromino size) with undo().
+
+    A parallel id layer is kept for rendering: id_rows[y][x] is the
+    tetromino id of every cell, with a list object per row so that a cleared
+    row is dropped and an empty one inserted at the top without copying any
+    cells. Copies made for the AI do not carry it.
+    """
+
+    def __init__(self, grid_width, grid_height, track_ids=True):
+        self.grid_width = grid_width
+        self.grid_height = grid_height
+        # mask with every column of a row set
+        self.full_row = (1 << grid_width) - 1
+        self.rows = [0] * grid_height
+        self.cols = [0] * grid_width
+        self.heights = [0] * grid_width
+        self.row_counts = [0] * grid_height
+        self.holes = [0] * grid_width
+        # undo records of the tetrominos added so far
+        self.history = []
+        self.id_rows = None
+        if track_ids:
+            self.id_rows = [[0] * grid_width for y in range(grid_height)]
+
+    def copy(self):
+        """Returns a copy of the board without the id layer and undo history."""
+
+        board = Bitboard(self.grid_width, self.grid_height, track_ids=False)
+        board.rows = self.rows[:]
+        board.cols = self.cols[:]
+        board.heights = self.heights[:]
+        board.row_counts = self.row_counts[:]
+        board.holes = self.holes[:]
+        return board
+
+    def is_colliding(self, tmino):
+        """Determines if a tetromino is out of bounds or overlaps any occupied
+        cell."""
+
+        x_pos = tmino.x_pos
+        y_pos = tmino.y_pos
+        # the precomputed bounds describe exactly the positions where every
+        # block of the tetromino lies within the grid
+        if (x_pos < tmino.min_x or x_pos > tmino.max_x
+            or y_pos < tmino.min_y or y_pos > tmino.max_y):
+            return True
+        rows = self.rows
+        y_pos += tmino.row_offset
+        x_pos += tmino.col_offset
+        for i, mask in enumerate(tmino.row_masks):
+            if rows[y_pos + i] & (mask << x_pos):
+                return True
+        return False
+
+    def add(self, tmino):
+        """Marks the cells of a tetromino as occupied and records how to undo
+        it. The tetromino must be within bounds and not colliding."""
+
+        rows = self.rows
+        row_counts = self.row_counts
+        y_pos = tmino.y_pos + tmino.row_offset
+        x_pos = tmino.x_pos + tmino.col_offset
+        for i, mask in enumerate(tmino.row_masks):
+            rows[y_pos + i] |= mask << x_pos
+            row_counts[y_pos + i] += tmino.row_sizes[i]
+
+        # only the columns covered by the tetromino change height
+        cols = self.cols
+        heights = self.heights
+        holes = self.holes
+        old_heights = heights[x_pos:x_pos + len(tmino.col_masks)]
+        old_holes = holes[x_pos:x_pos + len(tmino.col_masks)]
+        # height of the bottom of the tetromino box above the floor
+        base = self.grid_height - tmino.size - tmino.y_pos
+        for i, mask in enumerate(tmino.col_masks):
+            x = x_pos + i
+            cols[x] |= mask << y_pos
+            height = max(heights[x], base + tmino.top_profile[i])
+            # cells between the old and new height that the tetromino does not
+            # fill become holes, blocks placed into existing holes remove them
+            holes[x] += height - heights[x] - tmino.col_sizes[i]
+            heights[x] = height
+        self.history.append((tmino, old_heights, old_holes))
+
+    def undo(self):
+        """Removes the most recently added tetromino, restoring the board to
+        exactly the state before add()."""
+
+        tmino, old_heights, old_holes = self.history.pop()
+        rows = self.rows
+        row_counts = self.row_counts
+        y_pos = tmino.y_pos + tmino.row_offset
+        x_pos = tmino.x_pos + tmino.col_offset
+        for i, mask in enumerate(tmino.row_masks):
+            rows[y_pos + i] &= ~(mask << x_pos)
+            row_counts[y_pos + i] -= tmino.row_sizes[i]
+        cols = self.cols
+        for i, mask in enumerate(tmino.col_masks):
+            cols[x_pos + i] &= ~(mask << y_pos)
+        self.heights[x_pos:x_pos + len(old_heights)] = old_heights
+        self.holes[x_pos:x_pos + len(old_holes)] = old_holes
+
+    def place(self, tmino):
+        """Places a tetromino onto the grid and clears any completed lines.
+
+        Returns:
+            The number of lines cleared.
+        """
+
+        self.add(tmino)
+        # a placed tetromino is permanent
+        self.history.clear()
+        if self.id_rows is not None:
+            for x in range(tmino.size):
+                for y in range(tmino.size):
+                    if tmino.block_data[x][y]:
+                        self.id_rows[y + tmino.y_pos][x + tmino.x_pos] = tmino.id
+        # only the rows covered by the tetromino can have been completed
+        top = tmino.y_pos + tmino.row_offset
+        bottom = top + len(tmino.row_masks)
+        full_rows = [y for y in range(top, bottom) if self.row_counts[y] == self.grid_width]
+        # going from top to bottom, removing a row and inserting an empty one
+        # at the top leaves the position of every row below it untouched
+        for y in full_rows:
+            del self.rows[y]
+            self.rows.insert(0, 0)
+            del self.row_counts[y]
+            self.row_counts.insert(0, 0)
+            # every column has bit y set, drop it and move the bits above down
+            above = (1 << y) - 1
+            for x in range(self.grid_width):
+                col = self.cols[x]
+                self.cols[x] = ((col & above) << 1) | (col >> (y + 1) << (y + 1))
+            if self.id_rows is not None:
+                del self.id_rows[y]
+                self.id_rows.insert(0, [0] * self.grid_width)
+        if full_rows:
+            self.count_columns()
+        return len(full_rows)
+
+    def count_columns(self):
+        """Recomputes the heights and holes of every column from cols."""
+
+        for x, col in enumerate(self.cols):
+            if col:
+                # the highest occupied cell is the lowest set bit
+                height = self.grid_height - ((col & -col).bit_length() - 1)
+                self.heights[x] = height
+                self.holes[x] = height - bin(col).count('1')
+            else:
+                self.heights[x] = 0
+                self.holes[x] = 0
+
+    def pack(self):
+        """Packs every row mask into a single integer, two boards have the same
+        occupied cells exactly when their packed values are equal."""
+
+        key = 0
+        for row in self.rows:
+            key = key << self.grid_width | row
+        return key
+
+    @staticmethod
+    def from_grid(grid):
+        """Builds a bitboard from a column major grid, grid[x][y]."""
+
+        board = Bitboard(len(grid), len(grid[0]), track_ids=False)
+        for x in range(len(grid)):
+            for y in range(len(grid[0])):
+                if grid[x][y]:
+                    board.rows[y] |= 1 << x
+                    board.cols[x] |= 1 << y
+                    board.row_counts[y] += 1
+        board.count_columns()
+        return board
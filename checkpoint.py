@@ -0,0 +1,40 @@
+import os
+import pickle
+import tempfile
+
+# bumped whenever the layout of the saved state changes
+CHECKPOINT_VERSION = 1
+
+def save(path, state):
+    """Writes the state of a training run to a binary file.
+
+    The state is first written to a temporary file in the same directory
+    which then replaces the checkpoint, so an interrupted write never leaves a
+    corrupt checkpoint behind.
+
+    Args:
+        path: Location of the checkpoint file.
+        state: Dictionary of plain Python values (numbers, strings, lists,
+            tuples and dictionaries) describing the run.
+    """
+
+    directory = os.path.dirname(path) or '.'
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.checkpoint-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump({'version': CHECKPOINT_VERSION, 'state': state}, f, pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+def load(path):
+    """Reads the state of a training run written by save()."""
+
+    with open(path, 'rb') as f:
+        data = pickle.load(f)
+    if data.get('version') != CHECKPOINT_VERSION:
+        raise ValueError(f'Unsupported checkpoint version in {path}: {data.get("version")}')
+    return data['state']
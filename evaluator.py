@@ -0,0 +1,249 @@
+from concurrent.futures import ProcessPoolExecutor, Future, as_completed
+from multiprocessing import Value
+from random import randint
+from time import perf_counter
+from tetris import Tetris
+import tetromino
+import ai as ai_module
+
+# lines cleared a game must still be able to reach to enter the selection,
+# shared with the worker processes, negative while unknown
+abort_threshold = None
+
+class Budget:
+    """Limits on how long a single game is played during evaluation.
+
+    A limit of 0 disables it. With early_abort, a game is stopped once it can
+    no longer clear as many lines as the selection_size best finished games
+    of its generation, which requires max_pieces to bound the lines left.
+    """
+
+    def __init__(self, max_pieces=0, max_lines=0, max_seconds=0, early_abort=False):
+        self.max_pieces = max_pieces
+        self.max_lines = max_lines
+        self.max_seconds = max_seconds
+        self.early_abort = early_abort
+
+    def is_exhausted(self, inst, elapsed, threshold=-1):
+        """Determines if a game should be stopped.
+
+        Args:
+            inst: The Tetris instance.
+            elapsed: Seconds the game has been played for.
+            threshold: Lines cleared by the last selected finished game, or a
+                negative value if not enough games have finished yet.
+        """
+
+        if self.max_pieces and inst.pieces_placed >= self.max_pieces:
+            return True
+        if self.max_lines and inst.lines_cleared >= self.max_lines:
+            return True
+        if self.max_seconds and elapsed >= self.max_seconds:
+            return True
+        if self.early_abort and self.max_pieces and threshold >= 0:
+            return self.max_possible_lines(inst) < threshold
+        return False
+
+    def max_possible_lines(self, inst):
+        """An upper bound on the lines a game can clear before running out of
+        pieces, if every cell on the grid and of every remaining piece ended up
+        in a cleared line."""
+
+        cells = sum(inst.board.row_counts)
+        cells += (self.max_pieces - inst.pieces_placed) * tetromino.get_largest_tetromino_blocks()
+        lines = inst.lines_cleared + cells // inst.grid_width
+        if self.max_lines:
+            lines = min(lines, self.max_lines)
+        return lines
+
+class Evaluator:
+    """Plays every AI of a generation through a full game and reports the
+    lines cleared as its fitness.
+
+    With more than one worker, games are spread over a pool of processes that
+    is reused across generations, so a generation takes roughly
+    population_size / workers games worth of time.
+    """
+
+    def __init__(self, workers, grid_width, grid_height, shapes_path='data/shapes.txt',
+        transposition_size=0, budget=None, selection_size=0):
+        global abort_threshold
+
+        self.workers = workers
+        self.grid_width = grid_width
+        self.grid_height = grid_height
+        self.budget = budget if budget is not None else Budget()
+        self.selection_size = selection_size
+        self.threshold = Value('d', -1, lock=False)
+        abort_threshold = self.threshold
+        # transposition table lookups of the games played so far, every worker
+        # process has a table of its own
+        self.table_hits = 0
+        self.table_misses = 0
+        self.pool = None
+        if workers > 1:
+            self.pool = ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=init_worker,
+                initargs=(shapes_path, grid_width, grid_height, transposition_size, self.threshold))
+
+    def evaluate(self, ais, seeds=None):
+        """Returns the fitness of each AI, in the same order as ais.
+
+        Args:
+            ais: The AIs to evaluate.
+            seeds: Seeds of the games every AI plays, its fitness is then the
+                average lines cleared over these games. Defaults to a single
+                game per AI, seeded from the random module so that seeding it
+                makes the evaluation reproducible.
+        """
+
+        if seeds is None:
+            games = [(ai, randint(0, 2 ** 31 - 1)) for ai in ais]
+            seeds = [None]
+        else:
+            # one task per game, so that the games of a single AI are spread
+            # over the workers too
+            games = [(ai, seed) for ai in ais for seed in seeds]
+        # stopping a game early only works when the fitness is a single game
+        early_abort = self.budget.early_abort and len(seeds) == 1
+        self.threshold.value = -1
+        lines = [0] * len(games)
+        finished = []
+        if self.pool is None:
+            for i, (ai, seed) in enumerate(games):
+                lines[i], hits, misses = play_counted_game(ai, self.grid_width, self.grid_height, seed, self.budget)
+                self.count_table_stats(hits, misses)
+                if early_abort:
+                    self.update_threshold(finished, lines[i])
+        else:
+            futures = {}
+            for i, (ai, seed) in enumerate(games):
+                futures[self.pool.submit(play_counted_game, ai,
+                    self.grid_width, self.grid_height, seed, self.budget)] = i
+            for future in as_completed(futures):
+                lines[futures[future]], hits, misses = future.result()
+                self.count_table_stats(hits, misses)
+                if early_abort:
+                    self.update_threshold(finished, lines[futures[future]])
+        return [sum(lines[i:i + len(seeds)]) / len(seeds)
+            for i in range(0, len(lines), len(seeds))]
+
+    def submit(self, ai, seed):
+        """Starts a single game, used to evaluate AIs one at a time instead of
+        a generation at once. Without a pool the game is played right away.
+
+        Returns:
+            A Future of the lines cleared, the seconds the game took and the
+            transposition table hits and misses, see play_timed_game.
+        """
+
+        if self.pool is None:
+            future = Future()
+            future.set_result(play_timed_game(ai, self.grid_width, self.grid_height, seed, self.budget))
+            return future
+        return self.pool.submit(play_timed_game, ai, self.grid_width, self.grid_height, seed, self.budget)
+
+    def count_table_stats(self, hits, misses):
+        self.table_hits += hits
+        self.table_misses += misses
+
+    def take_table_stats(self):
+        """Returns the transposition table hits and misses of the games played
+        since the last call."""
+
+        stats = (self.table_hits, self.table_misses)
+        self.table_hits = 0
+        self.table_misses = 0
+        return stats
+
+    def update_threshold(self, finished, lines):
+        """Records a finished game, once selection_size games have finished the
+        threshold is the lowest lines cleared among the best of them."""
+
+        finished.append(lines)
+        if self.selection_size and len(finished) >= self.selection_size:
+            finished.sort(reverse=True)
+            self.threshold.value = finished[self.selection_size - 1]
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+def init_worker(shapes_path, grid_width, grid_height, transposition_size, threshold):
+    """Loads the tetromino tables in a worker process and gives it its own
+    transposition table.
+
+    Forked workers inherit the tables of the parent, spawned ones start empty.
+    """
+
+    global abort_threshold
+
+    if tetromino.unique_types == 0:
+        tetromino.load(shapes_path, grid_width, grid_height)
+    ai_module.enable_transposition_table(transposition_size)
+    abort_threshold = threshold
+
+def play_game(ai, grid_width, grid_height, seed=None, budget=None):
+    """Plays a single game with the given AI until it is lost or its budget
+    runs out.
+
+    Args:
+        seed: Seed of the tetromino sequence, random if None.
+        budget: Budget limiting the game, unlimited if None.
+
+    Returns:
+        The number of lines cleared.
+    """
+
+    inst = Tetris(grid_width, grid_height, seed)
+    start = perf_counter()
+    while not inst.lost:
+        # the move is computed once per tetromino and placed right away
+        if inst.next_move is not None:
+            inst.place_move(inst.next_move)
+        else:
+            inst.update()
+        if inst.lost:
+            break
+        if budget is not None and budget.is_exhausted(inst, perf_counter() - start,
+            abort_threshold.value if abort_threshold is not None else -1):
+            inst.stop()
+            break
+        inst.next_move = ai.compute_move(inst)
+    return inst.lines_cleared
+
+def play_counted_game(ai, grid_width, grid_height, seed=None, budget=None):
+    """Plays a game like play_game.
+
+    Returns:
+        The number of lines cleared and the hits and misses of the
+        transposition table of the process during the game.
+    """
+
+    lines = play_game(ai, grid_width, grid_height, seed, budget)
+    return (lines,) + take_table_stats()
+
+def play_timed_game(ai, grid_width, grid_height, seed=None, budget=None):
+    """Plays a game like play_game.
+
+    Returns:
+        The number of lines cleared, the seconds the game took and the hits
+        and misses of the transposition table of the process during the game.
+    """
+
+    start = perf_counter()
+    lines = play_game(ai, grid_width, grid_height, seed, budget)
+    return (lines, perf_counter() - start) + take_table_stats()
+
+def take_table_stats():
+    """Returns the hits and misses of the transposition table of the process
+    and resets them, so that every game reports only its own lookups."""
+
+    table = ai_module.transposition_table
+    if table is None:
+        return 0, 0
+    stats = (table.hits, table.misses)
+    table.reset_stats()
+    return stats
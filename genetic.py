@@ -0,0 +1,124 @@
+from random import randint
+from ai import TetrisAI
+
+def rank_fitness(lines_cleared):
+    """Sorts the AIs of a generation by fitness.
+
+    Args:
+        lines_cleared: Lines cleared by each AI.
+
+    Returns:
+        A list of (lines cleared, AI index) tuples from most to least lines
+        cleared, example: [(40, 3), (30, 2), ... (10, 9)].
+    """
+
+    # get fitness scores and sort
+    #sắp xếp điểm fitness
+    fitness_scores = [(lines, i) for i, lines in enumerate(lines_cleared)]
+    list.sort(fitness_scores, key=lambda elem: elem[0])
+    fitness_scores.reverse()
+    return fitness_scores
+
+def breed(ais, fitness_scores, population_size, selection_size, mutate_rate, ai_options={}):
+    """Produces the next generation of AIs.
+
+    The better half of the generation continues on as is, the rest of the
+    population is filled with mutated crossovers of two different parents
+    among the selection_size best. If the selected AIs barely cleared any
+    lines, the generation starts over with random weights.
+
+    Args:
+        ais: The AIs of the generation.
+        fitness_scores: Ranking of the AIs as returned by rank_fitness.
+        ai_options: Options of AIs created with random weights, see TetrisAI.
+
+    Returns:
+        A list of population_size AIs.
+    """
+
+    grid_width, grid_height = ais[0].grid_width, ais[0].grid_height
+    highest_scores = fitness_scores[:selection_size]
+    avg_most = sum([elem[0] for elem in highest_scores]) / len(highest_scores)
+    # prepare next generation
+    # chuẩn bị thế hệ tiếp theo
+    new_ais = []
+    # create completely new AIs if the average was too low
+    #tạo AI mới neeys điểm tb quá thấp
+    if avg_most <= 0.1:
+        [new_ais.append(TetrisAI(grid_width, grid_height, [], [], [], **ai_options)) for i in range(population_size)]
+    else:
+        # produce new generation
+        # let the upper third of the most fit of this generation continue on as is
+        #hãy để một phần ba trên của những người phù hợp nhất của thế hệ này tiếp tục như hiện tại
+        for i in range(population_size // 2):
+            new_ais.append(ais[fitness_scores[i][1]].clone())
+        # then crossover until the population size is reached
+        #sau đó giao nhau cho đến khi đạt đến kích thước quần thể
+
+        while len(new_ais) != population_size:
+            # randomly select two different parents
+            # ngẫu nhiên lựa 2 bố mẹ khác nhau
+            idx1 = randint(0, len(highest_scores) - 1)
+            idx2 = idx1
+            while idx2 == idx1:
+                idx2 = randint(0, len(highest_scores) - 1)
+            new_ais.append(ais[highest_scores[idx1][1]].crossover(
+                ais[highest_scores[idx2][1]]))
+            new_ais[-1].mutate(mutate_rate)
+    return new_ais
+
+class ElitePool:
+    """The best AIs evaluated so far, for steady-state evolution.
+
+    Instead of replacing a whole generation at once, every AI is added as soon
+    as its fitness is known and pushes out the worst AI once the pool is full.
+    Children are bred from the selection_size best AIs of the pool.
+    """
+
+    def __init__(self, size, selection_size, mutate_rate, grid_width, grid_height, ai_options={}):
+        self.size = size
+        self.selection_size = selection_size
+        self.mutate_rate = mutate_rate
+        self.grid_width = grid_width
+        self.grid_height = grid_height
+        self.ai_options = ai_options
+        # (fitness, AI) from most to least fit
+        self.entries = []
+
+    def add(self, fitness, ai):
+        """Adds an evaluated AI, behind the AIs with the same fitness.
+
+        Returns:
+            True if the AI is in the pool, False if it was not fit enough.
+        """
+
+        idx = len(self.entries)
+        while idx > 0 and self.entries[idx - 1][0] < fitness:
+            idx -= 1
+        self.entries.insert(idx, (fitness, ai))
+        del self.entries[self.size:]
+        return idx < self.size
+
+    def threshold(self):
+        """Returns the fitness of the last selected AI, or -1 while fewer than
+        selection_size AIs are in the pool."""
+
+        if len(self.entries) < self.selection_size:
+            return -1
+        return self.entries[self.selection_size - 1][0]
+
+    def breed(self):
+        """Returns a new AI, a mutated crossover of two different selected AIs,
+        or one with random weights while the selected AIs barely clear any
+        lines, like breed."""
+
+        highest_scores = self.entries[:self.selection_size]
+        if len(highest_scores) < 2 or sum([elem[0] for elem in highest_scores]) / len(highest_scores) <= 0.1:
+            return TetrisAI(self.grid_width, self.grid_height, [], [], [], **self.ai_options)
+        idx1 = randint(0, len(highest_scores) - 1)
+        idx2 = idx1
+        while idx2 == idx1:
+            idx2 = randint(0, len(highest_scores) - 1)
+        child = highest_scores[idx1][1].crossover(highest_scores[idx2][1])
+        child.mutate(self.mutate_rate)
+        return child
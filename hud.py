@@ -0,0 +1,56 @@
+from collections import OrderedDict
+import pygame
+
+class TextCache:
+    """Rendered text surfaces by (text, font, color), least recently used
+    first out once more than size are cached.
+
+    Labels and numbers repeat from frame to frame, so rendering each of them
+    once saves a font render and a surface allocation per label and frame.
+    """
+
+    def __init__(self, size=64):
+        self.size = size
+        self.surfaces = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, font, text, color=(255, 255, 255)):
+        key = (text, font, color)
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.surfaces.move_to_end(key)
+            self.hits += 1
+            return surface
+        self.misses += 1
+        surface = font.render(text, True, color)
+        self.surfaces[key] = surface
+        if len(self.surfaces) > self.size:
+            self.surfaces.popitem(last=False)
+        return surface
+
+class Caption:
+    """Sets the window caption only when its content changes.
+
+    Args:
+        format_caption: Builds the caption from the fields passed to update.
+    """
+
+    def __init__(self, format_caption):
+        self.format_caption = format_caption
+        self.fields = None
+        self.updates = 0
+
+    def update(self, *fields):
+        """Sets the caption if any of the fields changed since the last call.
+
+        Returns:
+            True if the caption was set.
+        """
+
+        if fields == self.fields:
+            return False
+        self.fields = fields
+        self.updates += 1
+        pygame.display.set_caption(self.format_caption(*fields))
+        return True
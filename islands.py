@@ -0,0 +1,165 @@
+from multiprocessing import Process, Queue, Event
+from queue import Empty
+from random import seed, randint
+import tetromino
+import ai as ai_module
+from ai import TetrisAI
+from evaluator import Evaluator
+import genetic
+
+class Island:
+    """Settings of a single sub-population of an IslandModel.
+
+    Args:
+        population_size: Number of AIs on the island.
+        selection_size: Number of AIs the next generation is bred from.
+        mutate_rate: Mutation chance of the children.
+        seed: Seed of the random module in the island's process.
+    """
+
+    def __init__(self, population_size, selection_size, mutate_rate, seed):
+        self.population_size = population_size
+        self.selection_size = selection_size
+        self.mutate_rate = mutate_rate
+        self.seed = seed
+
+class IslandModel:
+    """Evolves several populations in parallel, one process per island.
+
+    Every island runs its own generations with its own selection size and
+    mutation rate. Every migration_interval generations, an island sends
+    copies of its migration_size best AIs to the next island of a ring and
+    takes in whatever AIs the previous island has sent so far, replacing its
+    worst children. Islands never wait for each other, so a slow island does
+    not hold back the others.
+    """
+
+    def __init__(self, islands, grid_width, grid_height, ai_options={}, budget=None,
+        migration_interval=5, migration_size=2, common_sequences=0, max_generations=0,
+        shapes_path='data/shapes.txt', transposition_size=0, lockstep_simulation=False):
+        self.islands = islands
+        self.settings = {
+            'grid_width': grid_width,
+            'grid_height': grid_height,
+            'ai_options': ai_options,
+            'budget': budget,
+            'migration_interval': migration_interval,
+            'migration_size': migration_size,
+            'common_sequences': common_sequences,
+            'max_generations': max_generations,
+            'shapes_path': shapes_path,
+            'transposition_size': transposition_size,
+            'lockstep_simulation': lockstep_simulation,
+        }
+        self.processes = []
+        self.results = None
+        self.stop_event = None
+
+    def start(self):
+        # island i sends its migrants to inboxes[i + 1]
+        inboxes = [Queue() for island in self.islands]
+        self.results = Queue()
+        self.stop_event = Event()
+        for idx, island in enumerate(self.islands):
+            process = Process(target=run_island, args=(idx, island, self.settings,
+                inboxes[idx], inboxes[(idx + 1) % len(inboxes)], self.results, self.stop_event),
+                daemon=True)
+            process.start()
+            self.processes.append(process)
+
+    def reports(self):
+        """Yields (island index, generation, best fitness, average fitness,
+        best weights) as the islands finish their generations, until every
+        island has stopped."""
+
+        running = len(self.processes)
+        while running:
+            try:
+                report = self.results.get(timeout=1)
+            except Empty:
+                # an island that died without reporting is no longer running
+                running = sum([process.is_alive() for process in self.processes])
+                continue
+            if report[1] is None:
+                running -= 1
+            else:
+                yield report
+
+    def stop(self):
+        if self.stop_event is not None:
+            self.stop_event.set()
+
+    def close(self):
+        self.stop()
+        for process in self.processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self.processes = []
+
+def run_island(idx, island, settings, inbox, outbox, results, stop_event):
+    """Evolves the population of an island until it reaches max_generations or
+    the model is stopped, reporting every generation to results."""
+
+    # migrants left in the queue when the island stops are simply dropped
+    outbox.cancel_join_thread()
+    seed(island.seed)
+    grid_width, grid_height = settings['grid_width'], settings['grid_height']
+    if tetromino.unique_types == 0:
+        tetromino.load(settings['shapes_path'], grid_width, grid_height)
+    ai_module.enable_transposition_table(settings['transposition_size'])
+    if settings['lockstep_simulation']:
+        from population import PopulationEvaluator
+        evaluator = PopulationEvaluator(grid_width, grid_height, settings['budget'])
+    else:
+        evaluator = Evaluator(1, grid_width, grid_height, budget=settings['budget'],
+            selection_size=island.selection_size)
+    ai_options = settings['ai_options']
+    ais = [TetrisAI(grid_width, grid_height, [], [], [], **ai_options)
+        for i in range(island.population_size)]
+    generation = 0
+    try:
+        while not stop_event.is_set():
+            if settings['max_generations'] and generation >= settings['max_generations']:
+                break
+            seeds = None
+            if settings['common_sequences'] > 0:
+                seeds = [randint(0, 2 ** 31 - 1) for i in range(settings['common_sequences'])]
+            lines_cleared = evaluator.evaluate(ais, seeds)
+            fitness_scores = genetic.rank_fitness(lines_cleared)
+            best = ais[fitness_scores[0][1]]
+            results.put((idx, generation, fitness_scores[0][0], sum(lines_cleared) / len(lines_cleared),
+                (best.row_filled_weights, best.hole_height_weights, best.column_diff_weights)))
+            new_ais = genetic.breed(ais, fitness_scores, island.population_size,
+                island.selection_size, island.mutate_rate, ai_options)
+            generation += 1
+            if settings['migration_interval'] and generation % settings['migration_interval'] == 0:
+                migrate(ais, fitness_scores, new_ais, settings['migration_size'], inbox, outbox)
+            ais = new_ais
+    except KeyboardInterrupt:
+        pass
+    finally:
+        evaluator.close()
+        results.put((idx, None, 0, 0, None))
+
+def migrate(ais, fitness_scores, new_ais, migration_size, inbox, outbox):
+    """Sends the weights of the best AIs of a generation to the next island and
+    replaces the last children of the new generation, the crossovers, with
+    the AIs received from the previous island."""
+
+    outbox.put([(ais[i].row_filled_weights, ais[i].hole_height_weights, ais[i].column_diff_weights)
+        for lines, i in fitness_scores[:migration_size]])
+    migrants = []
+    while True:
+        try:
+            migrants.extend(inbox.get_nowait())
+        except Empty:
+            break
+    # only the most recent migrants are kept if several batches arrived, and
+    # never more than the crossovers
+    num = min(migration_size, len(new_ais) // 2)
+    migrants = migrants[len(migrants) - num:]
+    grid_width, grid_height = ais[0].grid_width, ais[0].grid_height
+    for i, weights in enumerate(migrants):
+        new_ais[len(new_ais) - 1 - i] = TetrisAI(grid_width, grid_height,
+            list(weights[0]), list(weights[1]), list(weights[2]), **ais[0].get_options())
@@ -0,0 +1,102 @@
+import numpy as np
+import pygame
+import tetromino
+
+class MosaicView:
+    """Renders every Tetris instance of the population at once as small tiles.
+
+    The ids of the cells of all instances are gathered into a single array,
+    laid out as tiles separated by a border, scaled up to the largest whole
+    number of pixels per cell that fits the window and turned into colors
+    with a palette lookup. The result is pushed with one
+    pygame.surfarray.blit_array per frame. Games that are over are dimmed.
+    """
+
+    def __init__(self, grid_width, grid_height):
+        self.grid_width = grid_width
+        self.grid_height = grid_height
+        # palette: empty cell, the tetromino colors, the border, then the
+        # dimmed colors of games that are over
+        colors = [(0, 0, 0)] + [tetromino.get_tetromino_color(id)
+            for id in range(1, tetromino.unique_types + 1)] + [(60, 60, 60)]
+        self.border_id = len(colors) - 1
+        self.lost_offset = len(colors)
+        self.palette = np.array(colors + [(r // 3, g // 3, b // 3) for r, g, b in colors], dtype=np.uint8)
+        # layout and surface for the current window size and population size
+        self.layout = None
+        self.mosaic_surface = None
+
+    def invalidate(self):
+        """Makes the next frame clear the whole surface."""
+
+        self.layout = None
+
+    def compute_layout(self, surface_size, num):
+        """Finds the number of columns of tiles and the pixels per cell that
+        show the most of num boards within the surface.
+
+        Returns:
+            (columns, rows, pixels per cell)
+        """
+
+        tile_width, tile_height = self.grid_width + 1, self.grid_height + 1
+        best = None
+        for cols in range(1, num + 1):
+            rows = -(-num // cols)
+            scale = min(surface_size[0] // (cols * tile_width), surface_size[1] // (rows * tile_height))
+            if best is None or scale > best[2]:
+                best = (cols, rows, scale)
+        if best[2] == 0:
+            # too many boards to fit, show as many as fit at a pixel per cell
+            cols = max(surface_size[0] // tile_width, 1)
+            rows = max(surface_size[1] // tile_height, 1)
+            best = (cols, rows, 1)
+        return best
+
+    def render(self, surface, instances):
+        """Draws every instance onto the surface.
+
+        Returns:
+            The list of rectangles of the surface that changed.
+        """
+
+        num = len(instances)
+        layout = (surface.get_size(), num)
+        if layout != self.layout:
+            self.layout = layout
+            self.cols, self.rows, self.scale = self.compute_layout(surface.get_size(), num)
+            width = self.cols * (self.grid_width + 1) * self.scale
+            height = self.rows * (self.grid_height + 1) * self.scale
+            self.mosaic_surface = pygame.Surface((width, height), depth=24)
+            surface.fill((0, 0, 0))
+            first_frame = True
+        else:
+            first_frame = False
+
+        tiles = self.cols * self.rows
+        shown = instances[:tiles]
+        # ids of every cell, with a border right of and below every board
+        ids = np.full((tiles, self.grid_width + 1, self.grid_height + 1), self.border_id, dtype=np.uint8)
+        ids[len(shown):] = 0
+        ids[:len(shown), :self.grid_width, :self.grid_height] = np.array(
+            [inst.id_rows for inst in shown], dtype=np.uint8).transpose(0, 2, 1)
+        for i, inst in enumerate(shown):
+            if inst.lost:
+                cells = ids[i, :self.grid_width, :self.grid_height]
+                cells[cells > 0] += self.lost_offset
+            else:
+                # draw the current tetromino
+                tmino = inst.current_tmino
+                block_data = tmino.block_data
+                for x in range(len(block_data)):
+                    for y in range(len(block_data[0])):
+                        if block_data[x][y] and 0 <= tmino.y_pos + y < self.grid_height:
+                            ids[i, tmino.x_pos + x, tmino.y_pos + y] = tmino.id
+        # lay the tiles out in rows, then scale every cell up
+        canvas = ids.reshape(self.rows, self.cols, self.grid_width + 1, self.grid_height + 1)
+        canvas = canvas.transpose(1, 2, 0, 3).reshape(self.cols * (self.grid_width + 1), self.rows * (self.grid_height + 1))
+        if self.scale > 1:
+            canvas = canvas.repeat(self.scale, axis=0).repeat(self.scale, axis=1)
+        pygame.surfarray.blit_array(self.mosaic_surface, self.palette[canvas])
+        rect = surface.blit(self.mosaic_surface, (0, 0))
+        return [surface.get_rect()] if first_frame else [rect]
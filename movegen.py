@@ -0,0 +1,209 @@
+from collections import deque
+import tetromino as tetromino_module
+from tetromino import get_tetromino_type, get_spawn_position
+
+class MoveTable:
+    """Precomputed information about a tetromino for the move generator.
+
+    Positions of a rotation are stored as bits of a mask, bit x - x_base is set
+    for position x, where x_base is the smallest x of any rotation. For every
+    block of a rotation, shifting a grid row right by the block shift moves
+    the occupied cells onto the positions where that block would overlap them.
+    """
+
+    def __init__(self, id):
+        types = [get_tetromino_type(id, rotation) for rotation in range(4)]
+        self.types = types
+        self.x_base = min([tmino_type.min_x for tmino_type in types])
+        self.max_y = max([tmino_type.max_y for tmino_type in types])
+        # rows from the top of the box to below the lowest block of any rotation
+        self.max_bottom = max([tmino_type.row_offset + len(tmino_type.row_masks) for tmino_type in types])
+        self.legal_masks = []
+        # for every rotation, (row offset, block shifts) of each of its rows
+        self.shifts = []
+        for tmino_type in types:
+            mask = 0
+            for x in tmino_type.legal_x:
+                mask |= 1 << (x - self.x_base)
+            self.legal_masks.append(mask)
+            rows = []
+            for i, row_mask in enumerate(tmino_type.row_masks):
+                rows.append((tmino_type.row_offset + i, [tmino_type.col_offset + b + self.x_base
+                    for b in range(row_mask.bit_length()) if row_mask >> b & 1]))
+            self.shifts.append(rows)
+        # every rotation maps onto the first rotationally unique rotation with
+        # the same shape, as (rotation, x offset, y offset)
+        unique = tetromino_module.unique_tmino_list[id - 1]
+        self.canonical = []
+        for tmino_type in types:
+            for rotation in unique:
+                other = types[rotation]
+                if other.row_masks == tmino_type.row_masks:
+                    self.canonical.append((rotation, tmino_type.col_offset - other.col_offset,
+                        tmino_type.row_offset - other.row_offset))
+                    break
+
+    def free_mask(self, rows, rotation, y):
+        """Returns the mask of positions where a rotation fits at row y."""
+
+        tmino_type = self.types[rotation]
+        if y < tmino_type.min_y or y > tmino_type.max_y:
+            return 0
+        blocked = 0
+        for row_offset, shifts in self.shifts[rotation]:
+            row = rows[y + row_offset]
+            if row:
+                for shift in shifts:
+                    blocked |= row >> shift if shift >= 0 else row << -shift
+        return self.legal_masks[rotation] & ~blocked
+
+# move tables by tetromino id
+move_tables = {}
+
+def get_move_table(id):
+    table = move_tables.get(id)
+    if table is None:
+        table = MoveTable(id)
+        move_tables[id] = table
+    return table
+
+def fill(seed, free):
+    """Spreads the positions of seed left and right within free."""
+
+    while True:
+        spread = seed | (((seed << 1) | (seed >> 1)) & free)
+        if spread == seed:
+            return seed
+        seed = spread
+
+def reachable_moves(board, id):
+    """Computes every resting position a tetromino can reach from where it
+    spawns by moving left, right, down and rotating clockwise, so placements
+    tucked under overhangs are found and rotations blocked by the stack are
+    not.
+
+    The states (rotation, x, y) reachable in a row only depend on the row
+    above, so rows are processed from top to bottom, with the x positions of
+    a row handled together as a bitmask. Empty rows, such as every row above
+    the stack, need no collision tests.
+
+    Returns:
+        A list of (rotation, x, y) tuples, with rotation one of the rotationally
+        unique rotations of the tetromino.
+    """
+
+    table = get_move_table(id)
+    rows = board.rows
+    x_base = table.x_base
+    spawn_x, spawn_y = get_spawn_position(id)
+    # lowest row at which every rotation lies entirely above the stack
+    top = 0
+    while top < len(rows) and rows[top] == 0:
+        top += 1
+    sky_y = top - table.max_bottom
+    moves = []
+    seen = set()
+    reach = [0, 0, 0, 0]
+    free = [table.free_mask(rows, rotation, spawn_y) for rotation in range(4)]
+    y = spawn_y - 1
+    while y < table.max_y:
+        y += 1
+        # move down from the row above
+        seed = [reach[rotation] & free[rotation] for rotation in range(4)]
+        if y == spawn_y:
+            seed[0] |= (1 << (spawn_x - x_base)) & free[0]
+        # spread left and right, then rotate, until nothing new is reached
+        reach = [0, 0, 0, 0]
+        changed = True
+        while changed:
+            changed = False
+            for rotation in range(4):
+                if seed[rotation] & ~reach[rotation]:
+                    reach[rotation] = fill(seed[rotation] | reach[rotation], free[rotation])
+                    changed = True
+                    following = (rotation + 1) % 4
+                    seed[following] |= reach[rotation] & free[following]
+        if not any(reach):
+            break
+        # every position is free in the rows above the stack, so once every
+        # rotation is within bounds the positions reached stay the same down
+        # to the stack and nothing rests on the way
+        if y < sky_y and free == table.legal_masks:
+            y = sky_y - 1
+            continue
+        # positions that cannot move down any further are resting positions
+        for rotation in range(4):
+            free[rotation] = table.free_mask(rows, rotation, y + 1)
+            resting = reach[rotation] & ~free[rotation]
+            if resting:
+                canonical, dx, dy = table.canonical[rotation]
+                while resting:
+                    low = resting & -resting
+                    move = (canonical, low.bit_length() - 1 + x_base + dx, y + dy)
+                    if move not in seen:
+                        seen.add(move)
+                        moves.append(move)
+                    resting ^= low
+    return moves
+
+def find_path(board, id, move):
+    """Finds the shortest sequence of inputs moving a tetromino from where it
+    spawns to a resting position found by reachable_moves.
+
+    Returns:
+        A list of 'left', 'right', 'down' and 'rotate' inputs, or None if the
+        position cannot be reached.
+    """
+
+    table = get_move_table(id)
+    rows = board.rows
+    # the position may be reached in any rotation with the same shape
+    targets = set()
+    for rotation in range(4):
+        canonical, dx, dy = table.canonical[rotation]
+        if canonical == move[0]:
+            targets.add((rotation, move[1] - dx, move[2] - dy))
+    spawn_x, spawn_y = get_spawn_position(id)
+    start = (0, spawn_x, spawn_y)
+    if not fits(table, rows, start):
+        return None
+    parents = {start: None}
+    queue = deque([start])
+    while queue:
+        state = queue.popleft()
+        if state in targets:
+            path = []
+            while parents[state] is not None:
+                state, step = parents[state]
+                path.append(step)
+            path.reverse()
+            return path
+        rotation, x, y = state
+        for step, following in (
+            ('left', (rotation, x - 1, y)),
+            ('right', (rotation, x + 1, y)),
+            ('down', (rotation, x, y + 1)),
+            ('rotate', ((rotation + 1) % 4, x, y))):
+            if following not in parents and fits(table, rows, following):
+                parents[following] = (state, step)
+                queue.append(following)
+    return None
+
+def fits(table, rows, state):
+    rotation, x, y = state
+    if x < table.x_base:
+        return False
+    return table.free_mask(rows, rotation, y) >> (x - table.x_base) & 1 == 1
+
+def format_path(path):
+    """Returns a short description of a path, such as 'rotate, left x2, down x14'."""
+
+    if path is None:
+        return 'unreachable'
+    runs = []
+    for step in path:
+        if runs and runs[-1][0] == step:
+            runs[-1][1] += 1
+        else:
+            runs.append([step, 1])
+    return ', '.join([step if num == 1 else f'{step} x{num}' for step, num in runs]) or 'none'
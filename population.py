@@ -0,0 +1,178 @@
+import numpy as np
+from random import Random, randint
+import tetromino
+from tetromino import get_tetromino_type, get_spawn_position
+from tetris import generate_id_sequence
+from vectorized import score_boards
+
+class DropTable:
+    """Every straight drop of a tetromino as arrays over its placements, in the
+    same order as TetrisAI.compute_moves_available."""
+
+    def __init__(self, id, grid_width, grid_height):
+        moves = []
+        for rotation in tetromino.unique_tmino_list[id - 1]:
+            for x in get_tetromino_type(id, rotation).legal_x:
+                moves.append((rotation, x))
+        self.moves = moves
+        types = [get_tetromino_type(id, rotation) for rotation, x in moves]
+        width = max([len(tmino_type.skirt) for tmino_type in types])
+        # columns covered by every placement and their skirts, padded with a
+        # skirt so large that it never decides the resting height
+        self.cols = np.zeros((len(moves), width), dtype=np.intp)
+        self.skirts = np.full((len(moves), width), 2 * grid_height + width, dtype=np.intp)
+        for i, ((rotation, x), tmino_type) in enumerate(zip(moves, types)):
+            for j, skirt in enumerate(tmino_type.skirt):
+                self.cols[i, j] = x + tmino_type.col_offset + j
+                self.skirts[i, j] = skirt
+            self.cols[i, len(tmino_type.skirt):] = self.cols[i, 0]
+        # the landing y is bottoms - resting height of the bottom of the box
+        self.bottoms = np.array([grid_height - tmino_type.size for tmino_type in types])
+        self.min_y = np.array([tmino_type.min_y for tmino_type in types])
+        # coordinates of every block relative to the box of the tetromino
+        self.block_x = np.array([[x + bx for bx in range(tmino_type.size) for by in range(tmino_type.size)
+            if tmino_type.block_data[bx][by]] for (rotation, x), tmino_type in zip(moves, types)])
+        self.block_y = np.array([[by for bx in range(tmino_type.size) for by in range(tmino_type.size)
+            if tmino_type.block_data[bx][by]] for tmino_type in types])
+        # blocks of the tetromino where it spawns
+        spawn_type = get_tetromino_type(id, 0)
+        spawn_x, spawn_y = get_spawn_position(id)
+        cells = [(spawn_x + bx, spawn_y + by) for bx in range(spawn_type.size) for by in range(spawn_type.size)
+            if spawn_type.block_data[bx][by]]
+        self.spawn_x = np.array([cell[0] for cell in cells])
+        self.spawn_y = np.array([cell[1] for cell in cells])
+
+class PopulationSimulator:
+    """Plays many games at once, one tetromino per step for every game.
+
+    The grids of all games are held in a single boolean array of shape
+    (games, grid_width, grid_height), indexed by [game, x, y]. Every step,
+    the straight drops of each game's tetromino are found from the heights of
+    its columns, all resulting grids are scored with vectorized.score_boards
+    using the weights of the game's AI, and the best one becomes the new grid
+    of the game. Finished games are masked out. The tetromino sequences match
+    those of Tetris instances with the same seeds, so a game plays out like a
+    TetrisAI with the drop move generator and no lookahead.
+    """
+
+    def __init__(self, grid_width, grid_height, budget=None):
+        if budget is not None and (budget.max_seconds or budget.early_abort):
+            raise ValueError('max_seconds and early_abort cannot be applied to single games played in lockstep')
+        self.grid_width = grid_width
+        self.grid_height = grid_height
+        self.budget = budget
+        self.tables = {id: DropTable(id, grid_width, grid_height)
+            for id in range(1, tetromino.unique_types + 1)}
+
+    def play(self, ais, seeds):
+        """Plays a game for every AI, ais[i] playing the sequence seeded with
+        seeds[i].
+
+        Returns:
+            The number of lines cleared in every game.
+        """
+
+        num = len(ais)
+        width, height = self.grid_width, self.grid_height
+        boards = np.zeros((num, width, height), dtype=bool)
+        heights = np.zeros((num, width), dtype=np.intp)
+        row_filled_weights = np.array([ai.row_filled_weights for ai in ais], dtype=float)
+        hole_height_weights = np.array([ai.hole_height_weights for ai in ais], dtype=float)
+        column_diff_weights = np.array([ai.column_diff_weights for ai in ais], dtype=float)
+        lines_cleared = np.zeros(num, dtype=np.intp)
+        pieces_placed = np.zeros(num, dtype=np.intp)
+        alive = np.ones(num, dtype=bool)
+
+        # the tetromino sequences are drawn in Python, a single id per game
+        # and step
+        rngs = [Random(seed) for seed in seeds]
+        sequences = [generate_id_sequence(rng) for rng in rngs]
+        current = np.array([seq.pop() for seq in sequences])
+        upcoming = [seq.pop() for seq in sequences]
+
+        while alive.any():
+            for id in np.unique(current[alive]):
+                games = np.flatnonzero(alive & (current == id))
+                self.place(self.tables[id], games, boards, heights, lines_cleared, alive,
+                    row_filled_weights, hole_height_weights, column_diff_weights)
+            pieces_placed[alive] += 1
+
+            # draw the next tetromino of every game still playing
+            for i in np.flatnonzero(alive):
+                current[i] = upcoming[i]
+                if len(sequences[i]) == 0:
+                    sequences[i] = generate_id_sequence(rngs[i])
+                upcoming[i] = sequences[i].pop()
+            # a game is lost once its new tetromino collides where it spawns
+            for id in np.unique(current[alive]):
+                games = np.flatnonzero(alive & (current == id))
+                table = self.tables[id]
+                alive[games[boards[games][:, table.spawn_x, table.spawn_y].any(axis=1)]] = False
+            if self.budget is not None:
+                if self.budget.max_pieces:
+                    alive &= pieces_placed < self.budget.max_pieces
+                if self.budget.max_lines:
+                    alive &= lines_cleared < self.budget.max_lines
+        return lines_cleared.tolist()
+
+    def place(self, table, games, boards, heights, lines_cleared, alive,
+        row_filled_weights, hole_height_weights, column_diff_weights):
+        """Places the tetromino of the given games, which all share the same
+        tetromino, at the best scoring straight drop."""
+
+        num, num_moves = len(games), len(table.moves)
+        # resting y of every placement of every game, see compute_moves_available
+        base = (heights[games][:, table.cols] - table.skirts).max(axis=2)
+        y = table.bottoms - base
+        valid = y >= table.min_y
+        y = np.where(valid, y, table.min_y)
+
+        candidates = np.repeat(boards[games][:, None], num_moves, axis=1)
+        candidates[np.arange(num)[:, None, None], np.arange(num_moves)[None, :, None],
+            table.block_x[None], y[:, :, None] + table.block_y[None]] = True
+        scores = score_boards(candidates.reshape(num * num_moves, self.grid_width, self.grid_height),
+            np.repeat(row_filled_weights[games], num_moves, axis=0),
+            np.repeat(hole_height_weights[games], num_moves, axis=0),
+            np.repeat(column_diff_weights[games], num_moves, axis=0)).reshape(num, num_moves)
+        scores[~valid] = -np.inf
+        # games where the tetromino fits nowhere are lost
+        alive[games[~valid.any(axis=1)]] = False
+        # argmax picks the first best move, just like the sequential loop
+        chosen = candidates[np.arange(num), scores.argmax(axis=1)]
+
+        # clear full rows by moving them to the top and emptying them, the
+        # stable sort keeps the order of the other rows
+        full = chosen.all(axis=1)
+        cleared = full.sum(axis=1)
+        if cleared.any():
+            order = np.argsort(~full, axis=1, kind='stable')
+            chosen = np.take_along_axis(chosen, order[:, None, :], axis=2)
+            chosen &= (np.arange(self.grid_height)[None, :] >= cleared[:, None])[:, None, :]
+            lines_cleared[games] += cleared
+        boards[games] = chosen
+        filled = chosen.any(axis=2)
+        heights[games] = np.where(filled, self.grid_height - chosen.argmax(axis=2), 0)
+
+class PopulationEvaluator:
+    """Evaluates a generation with a PopulationSimulator, a drop in
+    replacement for Evaluator when every AI uses the drop move generator
+    without lookahead."""
+
+    def __init__(self, grid_width, grid_height, budget=None):
+        self.simulator = PopulationSimulator(grid_width, grid_height, budget)
+
+    def evaluate(self, ais, seeds=None):
+        """Returns the fitness of each AI, in the same order as ais, see
+        Evaluator.evaluate."""
+
+        if seeds is None:
+            seeds = [None]
+            games = [(ai, randint(0, 2 ** 31 - 1)) for ai in ais]
+        else:
+            games = [(ai, seed) for ai in ais for seed in seeds]
+        lines = self.simulator.play([game[0] for game in games], [game[1] for game in games])
+        return [sum(lines[i:i + len(seeds)]) / len(seeds)
+            for i in range(0, len(lines), len(seeds))]
+
+    def close(self):
+        pass
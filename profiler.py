@@ -0,0 +1,157 @@
+import json
+from time import perf_counter
+
+class Profiler:
+    """Records where the time of the main loop goes.
+
+    Time is split into named phases (input, game, ai, render, wait, ...), the
+    time every AI takes to compute a move is kept in a histogram with
+    power of two buckets of microseconds, and the totals of every generation
+    are kept once it ends. Nothing is recorded while disabled.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.reset()
+
+    def reset(self):
+        # phase name: [total seconds, number of times recorded, longest]
+        self.phases = {}
+        # counts of move computations by bucket, bucket b holds latencies
+        # below 2 ** b microseconds, for all AIs and for every AI index of
+        # the current generation
+        self.move_histogram = []
+        self.ai_histograms = {}
+        self.moves = 0
+        self.move_seconds = 0
+        self.frames = 0
+        # phases, moves and frames of the current generation
+        self.generation_phases = {}
+        self.generation_moves = 0
+        self.generation_move_seconds = 0
+        self.generation_frames = 0
+        self.generations = []
+
+    def toggle(self):
+        self.enabled = not self.enabled
+        return self.enabled
+
+    def record(self, name, start):
+        """Adds the time since start to a phase.
+
+        Returns:
+            The current time, so that consecutive phases can be chained.
+        """
+
+        if not self.enabled:
+            return start
+        now = perf_counter()
+        elapsed = now - start
+        add_phase(self.phases, name, elapsed)
+        add_phase(self.generation_phases, name, elapsed)
+        return now
+
+    def record_move(self, ai_idx, start):
+        """Adds the time since start to the ai phase and the move latency
+        histograms.
+
+        Returns:
+            The current time, so that consecutive phases can be chained.
+        """
+
+        if not self.enabled:
+            return start
+        now = self.record('ai', start)
+        seconds = now - start
+        bucket = int(seconds * 1e6).bit_length()
+        add_bucket(self.move_histogram, bucket)
+        add_bucket(self.ai_histograms.setdefault(ai_idx, []), bucket)
+        self.moves += 1
+        self.move_seconds += seconds
+        self.generation_moves += 1
+        self.generation_move_seconds += seconds
+        return now
+
+    def record_frame(self):
+        if self.enabled:
+            self.frames += 1
+            self.generation_frames += 1
+
+    def end_generation(self, generation, population_size):
+        """Stores the totals of a generation and starts counting the next one."""
+
+        if self.enabled and (self.generation_phases or self.generation_moves):
+            self.generations.append({
+                'generation': generation,
+                'population_size': population_size,
+                'frames': self.generation_frames,
+                'moves': self.generation_moves,
+                'move_seconds': self.generation_move_seconds,
+                'phases': {name: phase[0] for name, phase in self.generation_phases.items()},
+            })
+        self.generation_phases = {}
+        self.generation_moves = 0
+        self.generation_move_seconds = 0
+        self.generation_frames = 0
+        # the AI at an index is a different one in the next generation
+        self.ai_histograms = {}
+
+    def report(self):
+        """Returns a printable summary of the recorded timings."""
+
+        total = sum([phase[0] for phase in self.phases.values()])
+        lines = ['\n----- Profile -----\n']
+        lines.append(f'{"Phase":>10} {"Total (s)":>10} {"Share":>7} {"Mean (ms)":>10} {"Max (ms)":>10}')
+        for name, (seconds, count, longest) in sorted(self.phases.items(), key=lambda elem: -elem[1][0]):
+            share = seconds / total * 100 if total > 0 else 0
+            lines.append(f'{name:>10} {seconds:10.3f} {share:6.1f}% {seconds / count * 1000:10.3f} {longest * 1000:10.3f}')
+        if self.frames:
+            lines.append(f'\nFrames: {self.frames}')
+        if self.moves:
+            lines.append(f'Moves computed: {self.moves}, {self.move_seconds / self.moves * 1e6:.1f}us on average')
+            lines.append('Move latency:')
+            for bucket, num in enumerate(self.move_histogram):
+                if num:
+                    lines.append(f'  < {format_micros(2 ** bucket):>7}: {num}')
+        for totals in self.generations[-5:]:
+            phases = ', '.join([f'{name} {seconds:.2f}s' for name, seconds in totals['phases'].items()])
+            lines.append(f'Generation {totals["generation"]}: {totals["moves"]} moves, {phases}')
+        return '\n'.join(lines)
+
+    def dump(self, path):
+        """Writes everything recorded so far to a JSON file."""
+
+        with open(path, 'w') as f:
+            json.dump({
+                'phases': {name: {'seconds': seconds, 'count': count, 'max': longest}
+                    for name, (seconds, count, longest) in self.phases.items()},
+                'frames': self.frames,
+                'moves': self.moves,
+                'move_seconds': self.move_seconds,
+                # bucket b counts the moves that took less than 2 ** b us
+                'move_histogram': self.move_histogram,
+                'ai_histograms': {str(idx): histogram for idx, histogram in sorted(self.ai_histograms.items())},
+                'generations': self.generations,
+            }, f, indent=4)
+
+def add_phase(phases, name, elapsed):
+    phase = phases.get(name)
+    if phase is None:
+        phases[name] = [elapsed, 1, elapsed]
+    else:
+        phase[0] += elapsed
+        phase[1] += 1
+        if elapsed > phase[2]:
+            phase[2] = elapsed
+
+def add_bucket(histogram, bucket):
+    if bucket >= len(histogram):
+        histogram.extend([0] * (bucket + 1 - len(histogram)))
+    histogram[bucket] += 1
+
+def format_micros(micros):
+    if micros >= 1000000:
+        return f'{micros // 1000000}s'
+    if micros >= 1000:
+        return f'{micros // 1000}ms'
+    return f'{micros}us'
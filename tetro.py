@@ -1,13 +1,35 @@
+import os
 import sys
 import math
-import pygame
-from time import time_ns
-from datetime import datetime
+import argparse
+from concurrent.futures import wait, FIRST_COMPLETED
+from time import time_ns, perf_counter
 from copy import deepcopy
-from random import random, randint
+from random import random, randint, seed, getstate, setstate
 from tetris import Tetris
+import ai as ai_module
 from ai import TetrisAI
+from evaluator import Evaluator, Budget
+from islands import Island, IslandModel
 import tetromino
+import checkpoint
+import genetic
+import movegen
+from weights_log import WeightsLog, WeightsLogReader
+from profiler import Profiler
+
+# pygame is only needed to display the games, training can run headless without it
+try:
+    import pygame
+    from view import TetrisView
+    from hud import Caption
+except ImportError:
+    pygame = None
+# numpy is only needed for the mosaic of every game
+try:
+    from mosaic import MosaicView
+except ImportError:
+    MosaicView = None
 
 class Tetro:
     """Entry point for Tetro.
@@ -16,7 +38,9 @@ class Tetro:
     in each generation of AIs. Handles Pygame window.
     """
 
-    def __init__(self):
+    def __init__(self, headless=False, max_generations=0, workers=1,
+        resume=False, checkpoint_path=None, initial_weights_path=None,
+        profile=False, islands=0):
         # basic Tetris and genetic algorithm properties
         self.grid_width = 0
         self.grid_height = 0
@@ -24,6 +48,50 @@ class Tetro:
         self.selection_size = 0
         self.mutate_rate = 0
         self.generation = 0
+        # options given to every AI, see TetrisAI
+        self.ai_options = {}
+        # number of board evaluations cached for the lookahead search
+        self.transposition_size = 0
+        # when positive, every AI of a generation plays the same number of
+        # games with the same seeded tetromino sequences (common random numbers)
+        self.common_sequences = 0
+        # seeds of the sequences of the current generation, None when random
+        self.generation_seeds = None
+        # limits on how long each game of a generation is played
+        self.budget = Budget()
+        # when headless, play every game of a generation at once with numpy,
+        # see population.py
+        self.lockstep_simulation = False
+        self.steady_state = False
+        # island model, see islands.py, the settings of island i fall back to
+        # the global selection_size and mutate_rate when the lists are shorter
+        self.islands = islands
+        self.migration_interval = 5
+        self.migration_size = 2
+        self.island_selection_sizes = []
+        self.island_mutate_rates = []
+        self.generation_start = 0
+        # transposition table lookups of the generation played by the worker
+        # processes of an Evaluator, see print_table_stats
+        self.table_hits = 0
+        self.table_misses = 0
+
+        # the whole population is saved to checkpoint_path every
+        # checkpoint_interval generations (0 = never), with resume the
+        # training continues from that checkpoint
+        self.checkpoint_interval = 0
+        self.checkpoint_path = checkpoint_path if checkpoint_path is not None else 'data/checkpoint.bin'
+        self.resume = resume
+        # (generation, most lines cleared, average lines cleared) of every
+        # generation so far
+        self.fitness_history = []
+        # weights log whose best genomes seed the first population, None to
+        # start from random weights only
+        self.initial_weights_path = initial_weights_path
+
+        # timings of the main loop, toggled with (t) and written to profile_path
+        self.profiler = Profiler(profile)
+        self.profile_path = 'data/profile.json'
 
         # size of cell in pixels (for rendering)
         #kích thước của ô tính bằng pixel (để hiển thị)
@@ -38,29 +106,73 @@ class Tetro:
         #chỉ mục của trò chơi tetris hiện đang được hiển thị trên màn hình
         self.current_spectating_idx = 0
 
+        # when headless, games are simulated without any window or rendering
+        # max_generations stops the simulation after that many generations (0 runs forever)
+        # headless games are evaluated in parallel by this many worker processes
+        self.headless = headless
+        self.max_generations = max_generations
+        self.workers = workers
+
         self.load_properties()
+        # naming a checkpoint file turns checkpointing on if the properties
+        # leave it off
+        if checkpoint_path is not None and self.checkpoint_interval == 0:
+            self.checkpoint_interval = 10
+        if self.lockstep_simulation and (self.ai_options.get('move_generator', 'bfs') != 'drop'
+            or self.ai_options.get('lookahead_depth', 1) > 1):
+            sys.exit('lockstep_simulation requires move_generator=drop and lookahead_depth=1')
+        if self.lockstep_simulation and (self.budget.max_seconds or self.budget.early_abort):
+            sys.exit('lockstep_simulation plays every game of a generation together and cannot '
+                'apply max_seconds or early_abort to single games')
+        if self.lockstep_simulation and self.steady_state:
+            sys.exit('lockstep_simulation plays whole generations and cannot be used with steady_state')
         tetromino.load('data/shapes.txt', self.grid_width, self.grid_height)
-        self.init_pygame()
+        # only the lookahead search consults the transposition table, without
+        # it the table would be allocated and never hit
+        if self.ai_options.get('lookahead_depth', 1) <= 1:
+            self.transposition_size = 0
+        ai_module.enable_transposition_table(self.transposition_size)
+        if not self.headless:
+            if pygame is None:
+                sys.exit('Pygame is required to display the games, run with --headless to train without it')
+            self.init_pygame()
 
         # list of ai delays that can be toggled through: danh sách AI delay
         self.ai_delay_list = [0, 1, 5, 10, 25, 100, 250, 500, 1000, 1500, 2000, 2500, 3000]
         self.current_ai_delay_idx = 1
         self.average_fps = 0
+        self.average_steps = 0
+        # frames rendered per second, and the most times the games are stepped
+        # between two frames (0 = as many as fit in a frame)
+        self.render_fps = 60
+        self.max_steps_per_frame = 0
 
-        # path to save the highest scoring AI weights to
+        # path to save the highest scoring AI weights to, see weights_log.py
         #lưu điểm AI cao nhất 
-        self.output_weight_path = 'data/weights.txt'
+        self.output_weight_path = 'data/weights.bin'
+        self.weights_log = None
         self.highest_score = 0
         self.next_move_outline = True
+        # show every game at once instead of the spectated one
+        self.mosaic = False
+        self.mosaic_view = None
 
         self.game_running = False
         self.game_paused = False
+        # when the AIs were last paused, time spent paused does not count
+        # towards max_seconds
+        self.pause_start = 0
 
     def start(self):
         print(
             'Have fun with Tetro. :)\n')
         self.game_running = True
-        self.game_loop()
+        if self.islands:
+            self.island_loop()
+        elif self.headless:
+            self.headless_loop()
+        else:
+            self.game_loop()
 
     # init pygame and any gui related components
     #bắt dầy pygame và giao diện liên quan 
@@ -76,15 +188,27 @@ class Tetro:
         # giao diện sẽ hiển thị tetromino tiếp theo 
         extra_width = (tetromino.get_largest_tetromino_size() + 2) * self.cell_width
         self.pygame_surface = pygame.display.set_mode((tetris_width + extra_width, tetris_height))
+        self.view = TetrisView(self.cell_width)
+        self.caption = Caption(self.format_gui_title)
 
     def handle_start_button_press(self):
         if self.game_paused:
-            self.game_paused = False
+            self.set_paused(False)
             self.start_button.set_text('Pause')
         else:
-            self.game_paused = True
+            self.set_paused(True)
             self.start_button.set_text('Start')
 
+    def set_paused(self, paused):
+        """Pauses or resumes the AIs, moving the start of the generation
+        forward by the time spent paused."""
+
+        if paused and not self.game_paused:
+            self.pause_start = perf_counter()
+        elif not paused and self.game_paused:
+            self.generation_start += perf_counter() - self.pause_start
+        self.game_paused = paused
+
     # loads game options from the properties file
     # load lựa chọn game từ file properties 
     def load_properties(self):
@@ -110,62 +234,333 @@ class Tetro:
                     self.selection_size = int(value)
                 elif key == 'mutate_rate':
                     self.mutate_rate = float(value)
+                elif key == 'batch_scoring':
+                    self.ai_options['batch_scoring'] = int(value) != 0
+                elif key == 'move_generator':
+                    self.ai_options['move_generator'] = value
+                elif key == 'lookahead_depth':
+                    self.ai_options['lookahead_depth'] = int(value)
+                elif key == 'beam_width':
+                    self.ai_options['beam_width'] = int(value)
+                elif key == 'transposition_size':
+                    self.transposition_size = int(value)
+                elif key == 'common_sequences':
+                    self.common_sequences = int(value)
+                elif key == 'max_pieces':
+                    self.budget.max_pieces = int(value)
+                elif key == 'max_lines':
+                    self.budget.max_lines = int(value)
+                elif key == 'max_seconds':
+                    self.budget.max_seconds = float(value)
+                elif key == 'early_abort':
+                    self.budget.early_abort = int(value) != 0
+                elif key == 'checkpoint_interval':
+                    self.checkpoint_interval = int(value)
+                elif key == 'lockstep_simulation':
+                    self.lockstep_simulation = int(value) != 0
+                elif key == 'render_fps':
+                    self.render_fps = int(value)
+                elif key == 'max_steps_per_frame':
+                    self.max_steps_per_frame = int(value)
+                elif key == 'steady_state':
+                    self.steady_state = int(value) != 0
+                elif key == 'migration_interval':
+                    self.migration_interval = int(value)
+                elif key == 'migration_size':
+                    self.migration_size = int(value)
+                elif key == 'island_selection_sizes':
+                    self.island_selection_sizes = [int(elem) for elem in value.split(',') if elem.strip()]
+                elif key == 'island_mutate_rates':
+                    self.island_mutate_rates = [float(elem) for elem in value.split(',') if elem.strip()]
 
     def game_loop(self):
-        self.generate_random_games(self.population_size)
+        """Runs the games with a fixed timestep, rendering at render_fps.
+
+        Every frame, the games are stepped once for every AI delay worth of time
+        that has passed, or as often as fits in the frame with no delay, but at
+        most max_steps_per_frame times if set. Time the simulation could not
+        catch up on is dropped instead of piling up.
+        """
+
+        self.start_population()
         self.print_starting_generation()
-        game_clock = pygame.time.Clock()
-        fps_timer, fps_counter = 0, 0
+        frame_seconds = 1 / self.render_fps if self.render_fps > 0 else 0
+        fps_timer, fps_counter, steps_counter = perf_counter(), 0, 0
 
         ai_clock = 0
+        last_frame = perf_counter()
         while self.game_running:
-            ai_clock += game_clock.get_time()
+            start = perf_counter()
+            ai_clock += (start - last_frame) * 1000
+            last_frame = start
+            deadline = start + frame_seconds
             self.handle_input()
-
-            # update game only when enough time has passed
-            ai_clock += game_clock.get_time()
-            if ai_clock >= self.ai_delay_list[self.current_ai_delay_idx]:
-                if not self.game_paused:
-                    self.update()
-                ai_clock -= self.ai_delay_list[self.current_ai_delay_idx]
-
+            start = self.profiler.record('input', start)
+
+            # step the games as many times as the AI delay and frame allow
+            delay = self.ai_delay_list[self.current_ai_delay_idx]
+            steps = 0
+            while not self.game_paused and ai_clock >= delay:
+                # the game and ai phases are recorded by update
+                self.update()
+                steps += 1
+                ai_clock -= delay
+                if self.max_steps_per_frame and steps >= self.max_steps_per_frame:
+                    break
+                if perf_counter() >= deadline:
+                    break
+            ai_clock = min(ai_clock, delay)
+            steps_counter += steps
+
+            start = perf_counter()
             self.render()
+            start = self.profiler.record('render', start)
             self.update_gui_title()
+            start = self.profiler.record('title', start)
 
-            # keep track of average FPS over the last 10 seconds
-            #theo dõi FPS trung bình trong 10 giây qua
+            # keep track of the frames and steps over the last second
+            #theo dõi FPS trung bình trong giây qua
             fps_counter += 1
-            fps_timer += game_clock.get_time()
-            if fps_timer >= 1000:
-                self.average_fps = fps_counter
-                fps_counter = 0
-                fps_timer -= 1000
+            if start - fps_timer >= 1:
+                self.average_fps = round(fps_counter / (start - fps_timer))
+                self.average_steps = round(steps_counter / (start - fps_timer))
+                fps_counter, steps_counter = 0, 0
+                fps_timer = start
+
+            # sleep for the rest of the frame, the games are only stepped at
+            # the start of the next one anyway
+            remaining = deadline - perf_counter()
+            if remaining > 0:
+                pygame.time.wait(int(remaining * 1000))
+            self.profiler.record('wait', start)
+            self.profiler.record_frame()
+        if self.profiler.enabled:
+            self.dump_profile()
+
+    def headless_loop(self):
+        """Simulates generations as fast as possible without rendering.
+
+        Each AI plays its game to completion, spread over the worker processes,
+        before the next generation is produced.
+        """
 
-            # run as fact as you can!
-            #chạy thực tế như bạn có thể!
-            pygame.time.wait(1)
-            game_clock.tick()
+        if self.steady_state:
+            self.steady_state_loop()
+            return
+        self.start_population()
+        self.print_starting_generation()
+        if self.lockstep_simulation:
+            # imported here since numpy is only needed for this evaluator
+            from population import PopulationEvaluator
+            evaluator = PopulationEvaluator(self.grid_width, self.grid_height, self.budget)
+        else:
+            evaluator = Evaluator(self.workers, self.grid_width, self.grid_height,
+                transposition_size=self.transposition_size,
+                budget=self.budget, selection_size=self.selection_size)
+        try:
+            while self.game_running:
+                start = perf_counter()
+                lines_cleared = evaluator.evaluate(self.tetris_ais, self.generation_seeds)
+                self.profiler.record('evaluate', start)
+                if not self.lockstep_simulation:
+                    self.table_hits, self.table_misses = evaluator.take_table_stats()
+                self.next_generation(lines_cleared)
+                if self.max_generations and self.generation >= self.max_generations:
+                    self.game_running = False
+        except KeyboardInterrupt:
+            print('\nStopped training')
+        finally:
+            evaluator.close()
+            if self.profiler.enabled:
+                self.dump_profile()
+
+    def steady_state_loop(self):
+        """Evolves the population one game at a time instead of a generation
+        at a time.
+
+        population_size games are kept running. As soon as an AI has played
+        its games, it joins the elite pool if it is fit enough and a child
+        bred from the pool starts playing in its place, so the workers never
+        wait for the slowest game of a generation. Every population_size
+        finished AIs count as a generation for the statistics, the weights log
+        and max_generations. With common_sequences, every AI plays the same
+        sequences, chosen once at the start, so that the fitness of AIs from
+        different points of the run can be compared.
+        """
+
+        self.start_population()
+        pool = genetic.ElitePool(self.population_size, self.selection_size, self.mutate_rate,
+            self.grid_width, self.grid_height, self.ai_options)
+        evaluator = Evaluator(self.workers, self.grid_width, self.grid_height,
+            transposition_size=self.transposition_size,
+            budget=self.budget, selection_size=self.selection_size)
+        seeds = self.generation_seeds
+        early_abort = self.budget.early_abort and not seeds
+        # future of a game: [AI, games left to play, lines cleared so far]
+        pending = {}
+        started = 0
+        batch = []
+        busy = 0
+        start = perf_counter()
+
+        def start_games(ai):
+            nonlocal started
+            started += 1
+            evaluation = [ai, len(seeds) if seeds else 1, 0]
+            for game_seed in seeds if seeds else [randint(0, 2 ** 31 - 1)]:
+                pending[evaluator.submit(ai, game_seed)] = evaluation
+
+        self.print_starting_generation()
+        try:
+            [start_games(ai) for ai in self.tetris_ais]
+            while pending and self.game_running:
+                done, not_done = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    evaluation = pending.pop(future)
+                    lines, seconds, hits, misses = future.result()
+                    evaluator.count_table_stats(hits, misses)
+                    busy += seconds
+                    evaluation[1] -= 1
+                    evaluation[2] += lines
+                    if evaluation[1] > 0:
+                        continue
+                    fitness = evaluation[2] / (len(seeds) if seeds else 1)
+                    pool.add(fitness, evaluation[0])
+                    batch.append(fitness)
+                    if early_abort:
+                        evaluator.threshold.value = pool.threshold()
+                    if len(batch) == self.population_size:
+                        # without a pool, games are played as they are
+                        # submitted and the single process is always busy
+                        utilization = None
+                        if evaluator.pool is not None:
+                            utilization = busy / ((perf_counter() - start) * evaluator.workers)
+                        self.profiler.record('evaluate', start)
+                        self.table_hits, self.table_misses = evaluator.take_table_stats()
+                        self.end_steady_state_generation(pool, batch, utilization)
+                        batch = []
+                        busy = 0
+                        start = perf_counter()
+                    if not self.max_generations or started < self.max_generations * self.population_size:
+                        start_games(pool.breed())
+        except KeyboardInterrupt:
+            print('\nStopped training')
+        finally:
+            for future in pending:
+                future.cancel()
+            evaluator.close()
+            if self.profiler.enabled:
+                self.dump_profile()
+
+    def end_steady_state_generation(self, pool, batch, utilization):
+        """Prints the statistics of the last population_size AIs to finish and
+        logs the weights of the elite pool."""
+
+        self.generation += 1
+        self.tetris_ais = [ai for fitness, ai in pool.entries]
+        fitness_scores = [(fitness, i) for i, (fitness, ai) in enumerate(pool.entries)]
+        highest_scores = fitness_scores[:self.selection_size]
+        num_decimals = 1 if self.common_sequences > 1 else 0
+        avg_batch = sum(batch) / len(batch)
+        avg_most = sum([elem[0] for elem in highest_scores]) / len(highest_scores)
+        print('Lines cleared: ', self.format_float_list(batch, num_decimals=num_decimals, delimiter=' '))
+        print('Lines cleared average: ', self.format_float_list([avg_batch]))
+        print('Elite lines cleared: ', self.format_float_list([elem[0] for elem in highest_scores], num_decimals=num_decimals, delimiter=' '))
+        print('Elite lines cleared average: ', self.format_float_list([avg_most]))
+        print('Most cleared row filled weights: ', self.format_float_list(self.tetris_ais[0].row_filled_weights, brackets=True))
+        print('Most cleared hole height weights: ', self.format_float_list(self.tetris_ais[0].hole_height_weights, brackets=True))
+        print('Most cleared column diff weights: ', self.format_float_list(self.tetris_ais[0].column_diff_weights, brackets=True))
+        if utilization is not None:
+            print(f'Worker utilization: {utilization * 100:.1f}%')
+        self.print_table_stats()
+        self.fitness_history.append((self.generation - 1, max(batch), avg_batch))
+        self.log_weights(highest_scores)
+        self.profiler.end_generation(self.generation - 1, self.population_size)
+        if not self.max_generations or self.generation < self.max_generations:
+            self.print_starting_generation()
+
+    def island_loop(self):
+        """Trains several populations at once with an IslandModel, printing the
+        results of every island as its generations finish."""
+
+        islands = []
+        for i in range(self.islands):
+            islands.append(Island(self.population_size,
+                self.island_selection_sizes[i] if i < len(self.island_selection_sizes) else self.selection_size,
+                self.island_mutate_rates[i] if i < len(self.island_mutate_rates) else self.mutate_rate,
+                randint(0, 2 ** 31 - 1)))
+            print(f'Island {i}: population size {islands[i].population_size}, '
+                f'selection size {islands[i].selection_size}, mutate rate {islands[i].mutate_rate}')
+        model = IslandModel(islands, self.grid_width, self.grid_height, self.ai_options, self.budget,
+            self.migration_interval, self.migration_size, self.common_sequences, self.max_generations,
+            transposition_size=self.transposition_size, lockstep_simulation=self.lockstep_simulation)
+        best = None
+        try:
+            model.start()
+            for idx, generation, most, average, weights in model.reports():
+                print(f'Island {idx} generation {generation}: most lines cleared {most:.0f}, average {average:.2f}')
+                if best is None or most > best[0]:
+                    best = (most, idx, generation, weights)
+        except KeyboardInterrupt:
+            print('\nStopped training')
+        finally:
+            model.close()
+        if best is not None:
+            print(f'\nMost lines cleared: {best[0]:.0f} on island {best[1]} in generation {best[2]}')
+            print('Row filled weights: ', self.format_float_list(best[3][0], brackets=True))
+            print('Hole height weights: ', self.format_float_list(best[3][1], brackets=True))
+            print('Column diff weights: ', self.format_float_list(best[3][2], brackets=True))
 
     def update(self):
         # update all Tetris instances that have not lost yet
         #update các trường hopwk Tetris vẫn chưa mất
         all_lost = True
-        for inst, ai in zip(self.tetris_instances, self.tetris_ais):
-            inst.update()
+        elapsed = perf_counter() - self.generation_start
+        threshold = self.compute_abort_threshold()
+        start = perf_counter()
+        for idx, (inst, ai) in enumerate(zip(self.tetris_instances, self.tetris_ais)):
+            # the move computed on the last update is at its resting position
+            # and is placed right away, so it is computed once per tetromino
+            if inst.next_move is not None:
+                inst.place_move(inst.next_move)
+            else:
+                inst.update()
+            # end games that ran out of budget
+            if not inst.lost and self.budget.is_exhausted(inst, elapsed, threshold):
+                inst.stop()
+            start = self.profiler.record('game', start)
             if inst.lost:
                 continue
             all_lost = False
             inst.next_move = ai.compute_move(inst)
+            start = self.profiler.record_move(idx, start)
 
         # start next generation if all Tetris instances have lost
         #bắt đầu thế hệ mới nếu tất cả trường hopwk tetris đã mất 
         if all_lost:
             self.next_generation()
+            self.profiler.record('generation', start)
+
+    def compute_abort_threshold(self):
+        """Returns the lines cleared by the last game that would be selected
+        among the finished games, or -1 if too few games have finished."""
+
+        if not self.budget.early_abort:
+            return -1
+        finished = [inst.lines_cleared for inst in self.tetris_instances if inst.lost]
+        if len(finished) < self.selection_size:
+            return -1
+        finished.sort(reverse=True)
+        return finished[self.selection_size - 1]
 
     def render(self):
-        self.pygame_surface.fill((0, 0, 0))
-        self.tetris_instances[self.current_spectating_idx].render(self.pygame_surface, self.next_move_outline)
-        pygame.display.flip()
+        # only the parts of the window that changed are pushed to the display
+        if self.mosaic:
+            dirty = self.mosaic_view.render(self.pygame_surface, self.tetris_instances)
+        else:
+            dirty = self.view.render(self.pygame_surface, self.tetris_instances[self.current_spectating_idx], self.next_move_outline)
+        if dirty:
+            pygame.display.update(dirty)
 
     # handles keyboard and window input
     def handle_input(self):
@@ -174,12 +569,18 @@ class Tetro:
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 sys.exit()
+            elif event.type == pygame.VIDEOEXPOSE:
+                # the window has to be drawn again from scratch
+                if self.mosaic:
+                    self.mosaic_view.invalidate()
+                else:
+                    self.view.invalidate()
             elif event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_q:
                     self.game_running = False
 
                 elif event.key == pygame.K_p: # pause
-                    self.game_paused = not self.game_paused
+                    self.set_paused(not self.game_paused)
                     if self.game_paused:
                         print('Paused AI')
                     else:
@@ -235,6 +636,25 @@ class Tetro:
                     else:
                         print('Turned off next move outline')
 
+                elif event.key == pygame.K_m: # toggle the mosaic of every game
+                    if MosaicView is None:
+                        print('NumPy is required to show every game at once')
+                    elif self.mosaic:
+                        self.mosaic = False
+                        self.view.invalidate()
+                    else:
+                        if self.mosaic_view is None:
+                            self.mosaic_view = MosaicView(self.grid_width, self.grid_height)
+                        self.mosaic_view.invalidate()
+                        self.mosaic = True
+
+                elif event.key == pygame.K_t: # toggle profiling
+                    if self.profiler.toggle():
+                        self.profiler.reset()
+                        print('Started profiling')
+                    else:
+                        self.dump_profile()
+
                 elif event.key == pygame.K_h: # display help for all commands
                     print(
                         '\n----- Help -----\n\n'
@@ -259,7 +679,56 @@ class Tetro:
                         '(i)\n'
                         '\tSpeed up AI delay.\n'
                         '(g)\n'
-                        '\tToggle next move outline.\n')
+                        '\tToggle next move outline.\n'
+                        '(m)\n'
+                        '\tShow every game at once, or go back to the current instance.\n'
+                        '(t)\n'
+                        '\tStart profiling, or stop and save the profile.\n')
+
+    def start_population(self):
+        """Creates the first population, either resumed from the checkpoint or
+        with random weights."""
+
+        if self.resume:
+            self.load_checkpoint()
+        else:
+            self.generate_random_games(self.population_size)
+
+    def save_checkpoint(self):
+        """Saves the population, generation, fitness history and random state."""
+
+        checkpoint.save(self.checkpoint_path, {
+            'generation': self.generation,
+            'grid_width': self.grid_width,
+            'grid_height': self.grid_height,
+            'population': [(ai.row_filled_weights, ai.hole_height_weights, ai.column_diff_weights)
+                for ai in self.tetris_ais],
+            'fitness_history': self.fitness_history,
+            'generation_seeds': self.generation_seeds,
+            'game_seeds': [inst.seed for inst in self.tetris_instances],
+            'random_state': getstate(),
+        })
+        print(f'Saved checkpoint of generation {self.generation} to {self.checkpoint_path}')
+
+    def load_checkpoint(self):
+        """Restores the state saved by save_checkpoint."""
+
+        state = checkpoint.load(self.checkpoint_path)
+        if state['grid_width'] != self.grid_width or state['grid_height'] != self.grid_height:
+            sys.exit(f'Checkpoint {self.checkpoint_path} was made for a '
+                f'{state["grid_width"]}x{state["grid_height"]} grid')
+        self.generation = state['generation']
+        self.fitness_history = state['fitness_history']
+        self.generation_seeds = state['generation_seeds']
+        setstate(state['random_state'])
+        self.population_size = len(state['population'])
+        self.tetris_ais = [TetrisAI(self.grid_width, self.grid_height,
+            list(weights[0]), list(weights[1]), list(weights[2]), **self.ai_options)
+            for weights in state['population']]
+        self.generation_start = perf_counter()
+        self.tetris_instances = [Tetris(self.grid_width, self.grid_height, game_seed)
+            for game_seed in state['game_seeds']]
+        print(f'Resumed generation {self.generation} from {self.checkpoint_path}')
 
     def generate_random_games(self, num=1):
         """Generates a completely new set of Tetris instanes and AIs with randomized weights."""
@@ -267,91 +736,140 @@ class Tetro:
 
         self.tetris_instances.clear()
         self.tetris_ais.clear()
+        self.choose_generation_seeds()
+        self.generation_start = perf_counter()
         for i in range(num):
-            self.tetris_instances.append(Tetris(self.grid_width, self.grid_height, self.cell_width))
-            self.tetris_ais.append(TetrisAI(self.grid_width, self.grid_height, [], [], []))
-
-    def next_generation(self):
-        """Ends the current generation and produces the next generation of AIs."""
+            self.tetris_instances.append(self.create_game())
+            self.tetris_ais.append(TetrisAI(self.grid_width, self.grid_height, [], [], [], **self.ai_options))
+        if self.initial_weights_path is not None:
+            self.load_initial_weights(num)
+
+    def load_initial_weights(self, num):
+        """Replaces the first AIs with the best genomes of a weights log, the
+        rest of the population keeps its random weights."""
+
+        reader = WeightsLogReader(self.initial_weights_path)
+        try:
+            genomes = reader.best_genomes(min(num, self.selection_size))
+        finally:
+            reader.close()
+        for i, (fitness, row_filled, hole_height, column_diff) in enumerate(genomes):
+            if len(row_filled) != self.grid_width + 1:
+                sys.exit(f'{self.initial_weights_path} was made for a grid {len(row_filled) - 1} wide')
+            self.tetris_ais[i] = TetrisAI(self.grid_width, self.grid_height,
+                row_filled, hole_height, column_diff, **self.ai_options)
+        print(f'Loaded {len(genomes)} genomes from {self.initial_weights_path}')
+
+    def next_generation(self, lines_cleared=None):
+        """Ends the current generation and produces the next generation of AIs.
+
+        Args:
+            lines_cleared: Lines cleared by each AI, defaults to the lines
+                cleared by the current Tetris instances.
+        """
         #kết thúc thế hệ hiện tại và sản sinh thế hệ mới 
 
         self.generation += 1
-        # get fitness scores and sort
-        #sắp xếp điểm fitness
-        fitness_scores = [(inst.lines_cleared, i) for i, inst in enumerate(self.tetris_instances)]
-        list.sort(fitness_scores, key=lambda elem: elem[0])
-        fitness_scores.reverse()
+        if lines_cleared is None:
+            lines_cleared = [inst.lines_cleared for inst in self.tetris_instances]
+        fitness_scores = genetic.rank_fitness(lines_cleared)
 
         avg_all = sum([elem[0] for elem in fitness_scores]) / len(fitness_scores)
-        print('Lines cleared: ', self.format_float_list([elem[0] for elem in fitness_scores], num_decimals=0, delimiter=' '))
+        # fitness averaged over several sequences is fractional
+        num_decimals = 1 if self.common_sequences > 1 else 0
+        print('Lines cleared: ', self.format_float_list([elem[0] for elem in fitness_scores], num_decimals=num_decimals, delimiter=' '))
         print('Lines cleared average: ', self.format_float_list([avg_all]))
+        self.fitness_history.append((self.generation - 1, fitness_scores[0][0], avg_all))
 
         highest_scores = fitness_scores[:self.selection_size]
         avg_most = sum([elem[0] for elem in highest_scores]) / len(highest_scores)
-        print('Most lines cleared: ', self.format_float_list([elem[0] for elem in highest_scores], num_decimals=0, delimiter=' '))
+        print('Most lines cleared: ', self.format_float_list([elem[0] for elem in highest_scores], num_decimals=num_decimals, delimiter=' '))
         print('Most lines cleared average: ', self.format_float_list([avg_most]))
 
         print('Most cleared row filled weights: ', self.format_float_list(self.tetris_ais[highest_scores[0][1]].row_filled_weights, brackets=True))
         print('Most cleared hole height weights: ', self.format_float_list(self.tetris_ais[highest_scores[0][1]].hole_height_weights, brackets=True))
         print('Most cleared column diff weights: ', self.format_float_list(self.tetris_ais[highest_scores[0][1]].column_diff_weights, brackets=True))
+        print('Most cleared search: ', self.tetris_ais[highest_scores[0][1]].describe_search())
+        self.print_table_stats()
 
-        # save the weights of the highest scoring AI
+        # save the weights of the highest scoring AIs
         #lưu ô với điểm cao nhất 
-        with open('data/weights.txt', 'a') as f:
-            f.write('\n')
-            f.write(str(datetime.now()) + '\n')
-            f.write(f'Generation: {self.generation - 1} | Instance: {self.current_spectating_idx + 1}/{self.population_size}\n')
-            f.write(f'Lines cleared: {fitness_scores[0][0]}\n')
-            f.write(self.format_float_list(self.tetris_ais[highest_scores[0][1]].row_filled_weights, brackets=True) + '\n')
-            f.write(self.format_float_list(self.tetris_ais[highest_scores[0][1]].hole_height_weights, brackets=True) + '\n')
-            f.write(self.format_float_list(self.tetris_ais[highest_scores[0][1]].column_diff_weights, brackets=True) + '\n')
-
-        # prepare next generation
-        # chuẩn bị thế hệ tiếp theo 
-        new_ais = []
-        # create completely new AIs if the average was too low
-        #tạo AI mới neeys điểm tb quá thấp 
-        if avg_most <= 0.1:
-            [new_ais.append(TetrisAI(self.grid_width, self.grid_height, [], [], [])) for i in range(self.population_size)]
-        else:
-            # produce new generation
-            # let the upper third of the most fit of this generation continue on as is
-            #hãy để một phần ba trên của những người phù hợp nhất của thế hệ này tiếp tục như hiện tại
-            for i in range(self.population_size // 2):
-                new_ais.append(self.tetris_ais[fitness_scores[i][1]].clone())
-            # then crossover until the population size is reached
-            #sau đó giao nhau cho đến khi đạt đến kích thước quần thể
-
-            while len(new_ais) != self.population_size:
-                # randomly select two different parents
-                # ngẫu nhiên lựa 2 bố mẹ khác nhau 
-                idx1 = randint(0, len(highest_scores) - 1)
-                idx2 = idx1
-                while idx2 == idx1:
-                    idx2 = randint(0, len(highest_scores) - 1)
-                new_ais.append(self.tetris_ais[highest_scores[idx1][1]].crossover(
-                    self.tetris_ais[highest_scores[idx2][1]]))
-                new_ais[-1].mutate(self.mutate_rate)
+        self.log_weights(highest_scores)
 
+        new_ais = genetic.breed(self.tetris_ais, fitness_scores, self.population_size,
+            self.selection_size, self.mutate_rate, self.ai_options)
+
+        self.profiler.end_generation(self.generation - 1, self.population_size)
         self.tetris_instances.clear()
-        [self.tetris_instances.append(Tetris(self.grid_width, self.grid_height, self.cell_width)) for i in range(self.population_size)]
+        self.choose_generation_seeds()
+        self.generation_start = perf_counter()
+        [self.tetris_instances.append(self.create_game()) for i in range(self.population_size)]
         self.tetris_ais.clear()
         self.tetris_ais = new_ais
+        if self.checkpoint_interval > 0 and self.generation % self.checkpoint_interval == 0:
+            self.save_checkpoint()
         self.print_starting_generation()
 
+    def log_weights(self, highest_scores):
+        """Appends the fitness and weights of the selected AIs to the weights log."""
+
+        if self.weights_log is None:
+            best = self.tetris_ais[highest_scores[0][1]]
+            self.weights_log = WeightsLog(self.output_weight_path, self.selection_size,
+                (len(best.row_filled_weights), len(best.hole_height_weights), len(best.column_diff_weights)))
+        self.weights_log.append(self.generation - 1, [(lines,
+            self.tetris_ais[i].row_filled_weights,
+            self.tetris_ais[i].hole_height_weights,
+            self.tetris_ais[i].column_diff_weights) for lines, i in highest_scores])
+
+    def dump_profile(self):
+        """Prints the profile and saves it to profile_path."""
+
+        print(self.profiler.report())
+        self.profiler.dump(self.profile_path)
+        print(f'Saved profile to {self.profile_path}')
+
+    def choose_generation_seeds(self):
+        """Draws the seeds of the tetromino sequences for a new generation."""
+
+        if self.common_sequences > 0:
+            self.generation_seeds = [randint(0, 2 ** 31 - 1) for i in range(self.common_sequences)]
+        else:
+            self.generation_seeds = None
+
+    def create_game(self):
+        """Creates a Tetris instance for the current generation.
+
+        Displayed games are played once per AI, on the first common sequence.
+        Otherwise each game is seeded from the random module, so that seeding
+        it makes the whole run reproducible.
+        """
+
+        return Tetris(self.grid_width, self.grid_height,
+            self.generation_seeds[0] if self.generation_seeds else randint(0, 2 ** 31 - 1))
+
     def update_gui_title(self):
-        """Updates the Pygame's window title."""
+        """Updates the Pygame's window title, if anything in it changed."""
+
+        self.caption.update(self.generation, self.current_spectating_idx + 1, self.population_size,
+            self.describe_game_state(self.tetris_instances[self.current_spectating_idx]),
+            self.average_fps, self.average_steps)
+
+    def format_gui_title(self, generation, viewing, population_size, state, fps, steps):
+        return (f'Tetro | Gen: {generation} Viewing: {viewing}/{population_size} {state}'
+            f' | FPS: {fps} | Steps/s: {steps}')
 
-        pygame.display.set_caption(
-                f'Tetro | Gen: {self.generation} ' +
-                f'Viewing: {self.current_spectating_idx + 1}/{self.population_size} ' +
-                ('(Lost)' if self.tetris_instances[self.current_spectating_idx].lost else '(Alive)') +
-                f' | FPS: {self.average_fps}')
+    def describe_game_state(self, inst):
+        if inst.stopped:
+            return '(Stopped)'
+        return '(Lost)' if inst.lost else '(Alive)'
 
     def print_starting_generation(self):
         """Prints a header for the new generation."""
 
         print(f'\n----- Starting Generation {self.generation} -----')
+        if self.generation_seeds:
+            print('Tetromino sequence seeds: ', ' '.join([str(elem) for elem in self.generation_seeds]))
 
     # returns a list of tuples containing the Tetris instance index and its score in sorted order
     # trả về một danh sách các bộ chứa chỉ mục phiên bản Tetris và điểm của nó theo thứ tự được sắp xếp
@@ -375,6 +893,25 @@ class Tetro:
         print('Row filled weights: ', self.format_float_list(self.tetris_ais[self.current_spectating_idx].row_filled_weights, brackets=True))
         print('Hole height weights: ', self.format_float_list(self.tetris_ais[self.current_spectating_idx].hole_height_weights, brackets=True))
         print('Column diff weights: ', self.format_float_list(self.tetris_ais[self.current_spectating_idx].column_diff_weights, brackets=True))
+        print('Search: ', self.tetris_ais[self.current_spectating_idx].describe_search())
+        inst = self.tetris_instances[self.current_spectating_idx]
+        if inst.next_move is not None:
+            move = (inst.next_move.rotation, inst.next_move.x_pos, inst.next_move.y_pos)
+            print('Next move inputs: ', movegen.format_path(movegen.find_path(inst.board, inst.next_move.id, move)))
+
+    def print_table_stats(self):
+        """Prints the transposition table hits and misses of the generation,
+        from the evaluator's worker processes and from this process."""
+
+        hits, misses = self.table_hits, self.table_misses
+        self.table_hits = self.table_misses = 0
+        table = ai_module.transposition_table
+        if table is not None:
+            hits += table.hits
+            misses += table.misses
+            table.reset_stats()
+        if hits + misses > 0:
+            print(f'Transposition table: {hits} hits, {misses} misses ({hits / (hits + misses) * 100:.1f}% hit rate)')
 
     def format_float_list(self, float_list, num_decimals=2, delimiter=', ', brackets=False):
         """Returns a nicely formatted list of floats."""
@@ -383,5 +920,30 @@ class Tetro:
         return f'[{s}]' if brackets else s
 
 if __name__ == '__main__':
-    tetro = Tetro()
+    parser = argparse.ArgumentParser(description='Tetris AI trained with a genetic algorithm.')
+    parser.add_argument('--headless', action='store_true',
+        help='train without opening a window, pygame is not required')
+    parser.add_argument('--generations', type=int, default=0,
+        help='stop after this many generations (default: run forever)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+        help='number of processes evaluating games when headless (default: all cores)')
+    parser.add_argument('--seed', type=int,
+        help='seed the random number generator to make a run reproducible')
+    parser.add_argument('--resume', action='store_true',
+        help='continue training from the checkpoint')
+    parser.add_argument('--checkpoint',
+        help='checkpoint file to save to and resume from, saving every 10 generations unless '
+        'checkpoint_interval is set (default: data/checkpoint.bin, only saved with checkpoint_interval)')
+    parser.add_argument('--initial-weights', metavar='LOG',
+        help='start from the best genomes of a weights log (e.g. data/weights.bin)')
+    parser.add_argument('--islands', type=int, default=0,
+        help='train this many populations in separate processes that exchange their best AIs, implies --headless')
+    parser.add_argument('--profile', action='store_true',
+        help='record where the time goes from the start, saved to data/profile.json on exit')
+    args = parser.parse_args()
+    if args.seed is not None:
+        seed(args.seed)
+    tetro = Tetro(headless=args.headless or args.islands > 0, max_generations=args.generations, workers=args.workers,
+        resume=args.resume, checkpoint_path=args.checkpoint, initial_weights_path=args.initial_weights,
+        profile=args.profile, islands=args.islands)
     tetro.start()
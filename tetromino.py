@@ -222,6 +222,13 @@ def random_tetromino():
     return Tetromino(idx + 1, 0,
         (tmino_type.max_x - tmino_type.min_x) // 2 + tmino_type.min_x, tmino_type.min_y)
 
+def get_spawn_position(id):
+    """Returns the (x, y) position a tetromino enters the grid at, in its
+    first rotation state."""
+
+    tmino_type = tmino_list[(id - 1) * 4]
+    return ((tmino_type.max_x - tmino_type.min_x) // 2, tmino_type.min_y)
+
 def get_tetromino_color(id):
     """Returns the color of the tetromino associated with a given id."""
 
@@ -236,13 +243,37 @@ def get_largest_tetromino_size():
             largest_idx = i
     return tmino_list[largest_idx * 4].size
 
+def get_largest_tetromino_blocks():
+    """Returns the number of blocks of the tetromino with the most blocks."""
+
+    return max([sum([sum(col) for col in tmino_list[i * 4].block_data]) for i in range(unique_types)])
+
 def print_block_data(block_data):
     """Draws tetromino block data to the console."""
     for y in range(len(block_data)):
         print(''.join(['@' if block_data[x][y] else '.' for x in range(len(block_data))]))
 
 class TetrominoType:
-    """Preprocessed information about a tetromino."""
+    """Preprocessed information about a tetromino.
+
+    Besides the bounds of the tetromino, a placement table is precomputed for
+    the bitboard and the AI:
+        row_masks: Bitmask of each non-empty row starting at row_offset, where
+            bit i is set when local column col_offset + i has a block.
+        skirt: For each non-empty column starting at col_offset, the number of
+            empty cells between its lowest block and the bottom of the box.
+        top_profile: For each non-empty column starting at col_offset, the
+            height of its highest block above the bottom of the box.
+        col_masks: Bitmask of each non-empty column starting at col_offset,
+            where bit j is set when local row row_offset + j has a block.
+        row_sizes, col_sizes: Number of blocks in each of those rows and
+            columns.
+        legal_x: Every x position where the tetromino is within the grid.
+
+    Given a heightmap, the bottom of the box of a tetromino dropped at x rests
+    at height max(heights[x + col_offset + i] - skirt[i]), and afterwards
+    column x + col_offset + i has height that value plus top_profile[i].
+    """
 
     def __init__(self, id, block_data, size, min_x, min_y, max_x, max_y, rotation, color):
         self.id = id
@@ -255,6 +286,32 @@ class TetrominoType:
         self.rotation = rotation
         self.color = color
 
+        cols = [x for x in range(size) if any(block_data[x])]
+        rows = [y for y in range(size) if any(block_data[x][y] for x in range(size))]
+        self.col_offset = cols[0]
+        self.row_offset = rows[0]
+        self.row_masks = []
+        for y in range(rows[0], rows[-1] + 1):
+            mask = 0
+            for x in cols:
+                if block_data[x][y]:
+                    mask |= 1 << (x - self.col_offset)
+            self.row_masks.append(mask)
+        self.row_sizes = [bin(mask).count('1') for mask in self.row_masks]
+        self.skirt = []
+        self.top_profile = []
+        self.col_masks = []
+        for x in range(cols[0], cols[-1] + 1):
+            filled = [y for y in range(size) if block_data[x][y]]
+            self.skirt.append(size - 1 - filled[-1])
+            self.top_profile.append(size - filled[0])
+            mask = 0
+            for y in filled:
+                mask |= 1 << (y - self.row_offset)
+            self.col_masks.append(mask)
+        self.col_sizes = [bin(mask).count('1') for mask in self.col_masks]
+        self.legal_x = list(range(min_x, max_x + 1))
+
 class Tetromino:
     """An instance of a tetromino."""
 
@@ -273,6 +330,15 @@ class Tetromino:
         self.max_x = type.max_x
         self.max_y = type.max_y
         self.color = type.color
+        self.row_masks = type.row_masks
+        self.row_sizes = type.row_sizes
+        self.col_masks = type.col_masks
+        self.col_sizes = type.col_sizes
+        self.row_offset = type.row_offset
+        self.col_offset = type.col_offset
+        self.skirt = type.skirt
+        self.top_profile = type.top_profile
+        self.legal_x = type.legal_x
         self.id = id
         self.rotation = rotation
 
@@ -0,0 +1,106 @@
+import numpy as np
+from tetromino import get_tetromino_type
+
+def candidate_boards(board, tmino_id, moves):
+    """Materializes the grid resulting from every move as a single array.
+
+    Args:
+        board: Bitboard the moves are made on.
+        tmino_id: Id of the tetromino being placed.
+        moves: List of (rotation, x, y) placements.
+
+    Returns:
+        A boolean array of shape (len(moves), grid_width, grid_height) indexed
+        by [move, x, y], where True indicates an occupied cell.
+    """
+
+    rows = np.array(board.rows, dtype=np.int64)
+    # unpack the row masks into a (grid_width, grid_height) grid
+    grid = ((rows[None, :] >> np.arange(board.grid_width)[:, None]) & 1).astype(bool)
+    boards = np.repeat(grid[None], len(moves), axis=0)
+
+    # gather the coordinates of every block of every move at once
+    move_idx, cell_x, cell_y = [], [], []
+    for i, (rotation, x_pos, y_pos) in enumerate(moves):
+        block_data = get_tetromino_type(tmino_id, rotation).block_data
+        for x in range(len(block_data)):
+            for y in range(len(block_data)):
+                if block_data[x][y]:
+                    move_idx.append(i)
+                    cell_x.append(x + x_pos)
+                    cell_y.append(y + y_pos)
+    boards[move_idx, cell_x, cell_y] = True
+    return boards
+
+def score_boards(boards, row_filled_weights, hole_height_weights, column_diff_weights):
+    """Computes the TetrisAI score of many grids at once.
+
+    This gives the same result as TetrisAI.compute_score for every grid, with
+    the rows filled, hole height and column diff features computed as array
+    operations over all grids.
+
+    Args:
+        boards: Boolean array of shape (n, grid_width, grid_height).
+        row_filled_weights, hole_height_weights, column_diff_weights: Weights
+            shared by all grids, or arrays of shape (n, num_weights) giving
+            the weights to use for each grid.
+
+    Returns:
+        An array of n scores.
+    """
+
+    row_filled_weights = np.asarray(row_filled_weights, dtype=float)
+    hole_height_weights = np.asarray(hole_height_weights, dtype=float)
+    column_diff_weights = np.asarray(column_diff_weights, dtype=float)
+    hole_height_cap = hole_height_weights.shape[-1]
+    column_diff_cap = column_diff_weights.shape[-1]
+    grid_height = boards.shape[2]
+
+    # add to score based on how filled the rows are
+    cells_filled = boards.sum(axis=1)
+    score = _lookup(row_filled_weights, cells_filled).sum(axis=1)
+
+    # subtract from score based on heights of holes
+    # for every cell, find the closest occupied cell above it in its column;
+    # cells without one are above the highest cell of the column
+    cell_y = np.arange(grid_height)
+    last_filled = np.maximum.accumulate(np.where(boards, cell_y, -1), axis=2)
+    in_column = last_filled >= 0
+    # length of the run of empty cells ending at each empty cell
+    hole_height = cell_y - last_filled
+    empty = ~boards
+    # runs of empty cells closed off by an occupied cell below them, holes
+    # are rare so only the cells ending a run are looked up
+    closed = empty[..., :-1] & boards[..., 1:] & in_column[..., :-1]
+    grid_idx, x_idx, y_idx = np.nonzero(closed)
+    penalty = _lookup_cells(hole_height_weights, grid_idx,
+        np.minimum(hole_height[grid_idx, x_idx, y_idx], hole_height_cap) - 1)
+    score -= np.bincount(grid_idx, weights=penalty, minlength=len(boards))
+    # runs of empty cells that reach the floor
+    floor = empty[..., -1] & in_column[..., -1]
+    grid_idx, x_idx = np.nonzero(floor)
+    penalty = _lookup_cells(hole_height_weights, grid_idx,
+        np.minimum(hole_height[grid_idx, x_idx, -1], hole_height_cap - 1))
+    score -= np.bincount(grid_idx, weights=penalty, minlength=len(boards))
+
+    # subtract from score based on differences in column heights
+    heights = np.where(boards.any(axis=2), grid_height - boards.argmax(axis=2), 0)
+    diffs = np.minimum(np.abs(np.diff(heights, axis=1)), column_diff_cap - 1)
+    score -= _lookup(column_diff_weights, diffs).sum(axis=1)
+    return score
+
+def _lookup_cells(weights, grid_idx, idx):
+    """Indexes weights by idx for cells of the grids grid_idx."""
+
+    if weights.ndim == 1:
+        return weights[idx]
+    return weights[grid_idx, idx]
+
+def _lookup(weights, idx):
+    """Indexes weights by idx, where weights is either shared by every grid or
+    has one row of weights per grid along the first axis of idx."""
+
+    if weights.ndim == 1:
+        return weights[idx]
+    flat = np.take_along_axis(weights, idx.reshape(idx.shape[0], -1), axis=1)
+    return flat.reshape(idx.shape)
@@ -0,0 +1,161 @@
+import pygame
+import tetromino
+from hud import TextCache
+
+class TetrisView:
+    """Renders Tetris instances with Pygame.
+
+    The Tetris game itself has no dependency on Pygame, so that games can be
+    simulated without a display. A single view is shared by every instance.
+
+    Only what changed since the previous frame is drawn. The view remembers
+    how every cell of the grid was last drawn and blits a cached sprite for
+    each cell that looks different now; the divider and labels come from a
+    background drawn once. render returns the rectangles that changed, to be
+    passed to pygame.display.update.
+    """
+
+    def __init__(self, cell_width):
+        self.cell_width = cell_width
+        self.font = pygame.font.Font(pygame.font.get_default_font(), 24)
+        self.text_cache = TextCache()
+        # cell sprites by (fill color, outline color), either may be None
+        self.sprites = {}
+        self.background = None
+        # shared (fill color, outline color) of an empty cell and of every
+        # tetromino id, so that building a frame allocates no tuples
+        self.cell_looks = None
+        # how every cell was last drawn, None until the first frame
+        self.shown = None
+        self.shown_next = None
+        self.shown_lines = None
+        self.lines_rect = None
+
+    def invalidate(self):
+        """Makes the next frame redraw everything, for example after the
+        window contents were lost."""
+
+        self.shown = None
+
+    def get_sprite(self, fill, outline):
+        sprite = self.sprites.get((fill, outline))
+        if sprite is None:
+            sprite = pygame.Surface((self.cell_width, self.cell_width))
+            sprite.fill((0, 0, 0))
+            if fill is not None:
+                pygame.draw.rect(sprite, fill, (0, 0, self.cell_width - 1, self.cell_width - 1))
+            if outline is not None:
+                pygame.draw.rect(sprite, outline, (0, 0, self.cell_width - 1, self.cell_width - 1), 2)
+            self.sprites[(fill, outline)] = sprite
+        return sprite
+
+    def build_background(self, surface, inst):
+        """Draws the parts that never change: the divider line and labels."""
+
+        background = pygame.Surface(surface.get_size())
+        background.fill((0, 0, 0))
+        # draw a divider line: vẽ đường phân chia
+        pygame.draw.rect(
+            background,
+            (255, 255, 255),
+            (inst.grid_width * self.cell_width, 0, 1, inst.grid_height * self.cell_width))
+        # draw next piece text
+        text_next, rect_next = self.render_text('Next piece:',
+            (inst.grid_width + 1) * self.cell_width, self.cell_width * 1.5)
+        background.blit(text_next, rect_next)
+        # draw lines cleared text: vẽ dòng chữ: dòng đã xoá
+        text_cleared, rect_cleared = self.render_text('Lines cleared:',
+            (inst.grid_width + 1) * self.cell_width, (tetromino.get_largest_tetromino_size() + 3) * self.cell_width)
+        background.blit(text_cleared, rect_cleared)
+        self.background = background
+        self.cell_looks = [(None, None)] + [(tetromino.get_tetromino_color(id), None)
+            for id in range(1, tetromino.unique_types + 1)]
+
+    def render(self, surface, inst, next_move_outline):
+        """Draws the instance onto the surface.
+
+        Returns:
+            The list of rectangles of the surface that changed.
+        """
+
+        dirty = []
+        if self.shown is None or self.background is None or self.background.get_size() != surface.get_size():
+            self.build_background(surface, inst)
+            surface.blit(self.background, (0, 0))
+            dirty.append(surface.get_rect())
+            self.shown = [[(None, None)] * inst.grid_width for y in range(inst.grid_height)]
+            self.shown_next = None
+            self.shown_lines = None
+
+        # how every cell looks this frame, starting from the grid
+        # vẽ lưới
+        looks = self.cell_looks
+        cells = [[looks[id] for id in row] for row in inst.id_rows]
+        if not inst.lost:
+            # draw current tetromino
+            self.add_blocks(cells, inst.current_tmino, True)
+            # if specified, draw the next move outline
+            if next_move_outline and inst.next_move is not None:
+                self.add_blocks(cells, inst.next_move, False)
+        for y in range(inst.grid_height):
+            shown, row = self.shown[y], cells[y]
+            if row == shown:
+                continue
+            for x in range(inst.grid_width):
+                if row[x] != shown[x]:
+                    shown[x] = row[x]
+                    dirty.append(surface.blit(self.get_sprite(*row[x]),
+                        (x * self.cell_width, y * self.cell_width)))
+
+        # render next tetromino under next piece next:
+        # hoàn trả tetromino tiếp theo dưới
+        next_key = (inst.next_tmino.id, inst.next_tmino.rotation)
+        if next_key != self.shown_next:
+            self.shown_next = next_key
+            size = tetromino.get_largest_tetromino_size()
+            area = pygame.Rect((inst.grid_width + 1) * self.cell_width, int(3.5 * self.cell_width),
+                size * self.cell_width, size * self.cell_width)
+            surface.blit(self.background, area, area)
+            block_data = inst.next_tmino.block_data
+            sprite = self.get_sprite(inst.next_tmino.color, None)
+            for x in range(len(block_data)):
+                for y in range(len(block_data[0])):
+                    if block_data[x][y]:
+                        surface.blit(sprite, (area.x + x * self.cell_width, area.y + y * self.cell_width))
+            dirty.append(area)
+
+        # draw lines cleared number
+        # vẽ những dòng số đã xoá
+        if inst.lines_cleared != self.shown_lines:
+            self.shown_lines = inst.lines_cleared
+            text_lines, rect_lines = self.render_text(str(inst.lines_cleared),
+                (inst.grid_width + 1) * self.cell_width, (tetromino.get_largest_tetromino_size() + 4) * self.cell_width)
+            # clear the previous number, which may have been wider
+            area = rect_lines if self.lines_rect is None else rect_lines.union(self.lines_rect)
+            surface.blit(self.background, area, area)
+            surface.blit(text_lines, rect_lines)
+            self.lines_rect = rect_lines
+            dirty.append(area)
+        return dirty
+
+    def add_blocks(self, cells, tmino, filled):
+        """Adds the blocks of a tetromino to the cells of a frame, indexed by
+        [y][x], as filled cells or as outlines drawn over the cell."""
+
+        block_data = tmino.block_data
+        for x in range(len(block_data)):
+            for y in range(len(block_data[0])):
+                if block_data[x][y]:
+                    cell_x, cell_y = x + tmino.x_pos, y + tmino.y_pos
+                    if 0 <= cell_y < len(cells) and 0 <= cell_x < len(cells[0]):
+                        fill, outline = cells[cell_y][cell_x]
+                        if filled:
+                            cells[cell_y][cell_x] = (tmino.color, outline)
+                        else:
+                            cells[cell_y][cell_x] = (fill, tmino.color)
+
+    def render_text(self, text, top, left):
+        text_render = self.text_cache.render(self.font, text)
+        text_rect = text_render.get_rect()
+        text_rect.topleft = (top, left)
+        return (text_render, text_rect)
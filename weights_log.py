@@ -0,0 +1,177 @@
+import os
+import sys
+import mmap
+import struct
+from datetime import datetime
+
+# file layout, all values little endian:
+#   header: magic, top_k, then the number of row filled, hole height and
+#           column diff weights of every genome
+#   records: generation, timestamp, then top_k entries of fitness followed by
+#            the weights of the genome, missing entries have a NaN fitness
+MAGIC = b'TETROWL1'
+HEADER_FORMAT = '<8s4I'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+class WeightsLog:
+    """Append only log of the best genomes of every generation.
+
+    Every generation is stored as a fixed size record, so any generation can be
+    located from its index without parsing the rest of the file.
+    """
+
+    def __init__(self, path, top_k, weight_counts):
+        """Opens the log for appending, creating it if it does not exist.
+
+        Args:
+            path: Location of the log file.
+            top_k: Number of genomes stored per generation, ignored if the
+                file already exists.
+            weight_counts: Number of (row filled, hole height, column diff)
+                weights of every genome.
+        """
+
+        self.path = path
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path, 'rb') as f:
+                self.top_k, counts = read_header(f.read(HEADER_SIZE), path)
+            if counts != tuple(weight_counts):
+                raise ValueError(f'{path} stores genomes with {counts} weights, not {tuple(weight_counts)}')
+        else:
+            self.top_k = top_k
+            counts = tuple(weight_counts)
+            with open(path, 'wb') as f:
+                f.write(struct.pack(HEADER_FORMAT, MAGIC, top_k, *counts))
+        self.weight_counts = counts
+        self.record_format = record_format(self.top_k, counts)
+
+    def append(self, generation, genomes, timestamp=None):
+        """Appends a record for a generation.
+
+        Args:
+            generation: The generation number.
+            genomes: List of (fitness, row_filled_weights, hole_height_weights,
+                column_diff_weights) from best to worst, only the first top_k
+                are stored.
+            timestamp: Seconds since the epoch, defaults to now.
+        """
+
+        if timestamp is None:
+            timestamp = datetime.now().timestamp()
+        values = [generation, timestamp]
+        for i in range(self.top_k):
+            if i < len(genomes):
+                fitness, row_filled, hole_height, column_diff = genomes[i]
+                values.append(fitness)
+                values.extend(row_filled)
+                values.extend(hole_height)
+                values.extend(column_diff)
+            else:
+                values.extend([float('nan')] * (1 + sum(self.weight_counts)))
+        with open(self.path, 'ab') as f:
+            f.write(struct.pack(self.record_format, *values))
+
+class WeightsLogReader:
+    """Reads a weights log through a memory map."""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.top_k, self.weight_counts = read_header(self.map[:HEADER_SIZE], path)
+        self.record_format = record_format(self.top_k, self.weight_counts)
+        self.record_size = struct.calcsize(self.record_format)
+
+    def __len__(self):
+        return (len(self.map) - HEADER_SIZE) // self.record_size
+
+    def read(self, idx):
+        """Returns the record at index idx as a dictionary with the generation,
+        timestamp and list of (fitness, row_filled_weights,
+        hole_height_weights, column_diff_weights) genomes."""
+
+        if idx < 0:
+            idx += len(self)
+        if idx < 0 or idx >= len(self):
+            raise IndexError(f'record {idx} out of range')
+        values = struct.unpack_from(self.record_format, self.map, HEADER_SIZE + idx * self.record_size)
+        num_rows, num_holes, num_diffs = self.weight_counts
+        genomes = []
+        pos = 2
+        for i in range(self.top_k):
+            fitness = values[pos]
+            weights = list(values[pos + 1:pos + 1 + num_rows + num_holes + num_diffs])
+            pos += 1 + len(weights)
+            # NaN marks a missing genome
+            if fitness == fitness:
+                genomes.append((fitness, weights[:num_rows],
+                    weights[num_rows:num_rows + num_holes], weights[num_rows + num_holes:]))
+        return {'generation': values[0], 'timestamp': values[1], 'genomes': genomes}
+
+    def load_generation(self, generation):
+        """Returns the latest record of a generation.
+
+        Generations are logged in order, so the record is found directly from
+        the first generation in the log. Resumed runs may log a generation
+        again, in which case the log is searched from the end.
+        """
+
+        if len(self) == 0:
+            raise KeyError(generation)
+        idx = generation - self.read(0)['generation']
+        if 0 <= idx < len(self) and self.read(idx)['generation'] == generation and (
+            idx == len(self) - 1 or self.read(idx + 1)['generation'] != generation):
+            return self.read(idx)
+        for idx in range(len(self) - 1, -1, -1):
+            record = self.read(idx)
+            if record['generation'] == generation:
+                return record
+        raise KeyError(generation)
+
+    def best_genomes(self, num):
+        """Returns the num best distinct genomes across every generation.
+
+        The best AIs of a generation carry on unchanged into the next one, so
+        the same weights are logged again in every generation they survive,
+        only their highest fitness is kept.
+        """
+
+        best = {}
+        for idx in range(len(self)):
+            for genome in self.read(idx)['genomes']:
+                key = tuple(genome[1]) + tuple(genome[2]) + tuple(genome[3])
+                if key not in best or genome[0] > best[key][0]:
+                    best[key] = genome
+        genomes = sorted(best.values(), key=lambda elem: elem[0], reverse=True)
+        return genomes[:num]
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+def read_header(data, path):
+    if len(data) < HEADER_SIZE:
+        raise ValueError(f'{path} is not a weights log')
+    magic, top_k, num_rows, num_holes, num_diffs = struct.unpack(HEADER_FORMAT, data)
+    if magic != MAGIC:
+        raise ValueError(f'{path} is not a weights log')
+    return top_k, (num_rows, num_holes, num_diffs)
+
+def record_format(top_k, weight_counts):
+    return '<qd' + 'd' * (top_k * (1 + sum(weight_counts)))
+
+if __name__ == '__main__':
+    # print a weights log: python weights_log.py data/weights.bin [generation]
+    reader = WeightsLogReader(sys.argv[1])
+    if len(sys.argv) > 2:
+        records = [reader.load_generation(int(sys.argv[2]))]
+    else:
+        records = [reader.read(i) for i in range(len(reader))]
+    for record in records:
+        print(f'Generation: {record["generation"]} | {datetime.fromtimestamp(record["timestamp"])}')
+        for fitness, row_filled, hole_height, column_diff in record['genomes']:
+            print(f'  Lines cleared: {fitness:g}')
+            print('    ' + ', '.join([f'{w:.2f}' for w in row_filled]))
+            print('    ' + ', '.join([f'{w:.2f}' for w in hole_height]))
+            print('    ' + ', '.join([f'{w:.2f}' for w in column_diff]))
+    reader.close()